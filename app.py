@@ -17,6 +17,11 @@ socketio = SocketIO(app, async_mode="gevent")
 
 MODULES_DIR = Path("modules")
 STATS_FILE = Path("data/system_stats.json")
+STATUS_FILES = {
+    "ingest": Path("data/ingest_stats.json"),
+    "encode": Path("data/ffmpeg_progress.json"),
+    "tts": Path("data/tts_usage.json"),
+}
 
 # Register log related SocketIO events
 register_log_sockets(socketio, MODULES_DIR)
@@ -100,7 +105,7 @@ def yt_auth_code():
 # SocketIO System Stats
 @socketio.on("connect")
 def on_connect():
-    socketio.start_background_task(push_stats, socketio, STATS_FILE)
+    socketio.start_background_task(push_stats, socketio, STATS_FILE, STATUS_FILES)
 
 if __name__ == "__main__":
     from core.engine.gpu import detect_gpu_backend
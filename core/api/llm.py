@@ -2,8 +2,17 @@
 
 import os
 import json
+import time
+import asyncio
+import hashlib
+from pathlib import Path
+from typing import Callable, Iterator
 from google import genai
+from google.genai import types
+from pydantic import BaseModel, Field
 from dotenv import load_dotenv
+from core.api import model_health
+from core.utils.common import atomic_write, evict_lru
 
 load_dotenv()
 
@@ -22,40 +31,248 @@ FALLBACK_MODELS = [
     "gemini-3.5-flash-lite"
 ]
 
-# Basic LLM Request Helper
-def gpt_request(prompt: str) -> str:
-    """Send a prompt to Gemini, cascading through models if 503 is encountered."""
+# Response cache (opt-in per call via cache_ttl)
+LLM_CACHE_DIR = Path("data/llm_cache")
+LLM_CACHE_MAX_BYTES = 64 * 1024 * 1024
+STORY_CACHE_TTL = 7 * 24 * 3600
+METADATA_CACHE_TTL = 24 * 3600
+
+def _config_digest(config: types.GenerateContentConfig | None) -> str:
+    """Digest of the config fields set on a request (response format, schema, sampling)."""
+    if config is None:
+        return ""
+    fields = {}
+    for name, value in config:
+        if value is None:
+            continue
+        if isinstance(value, type) and issubclass(value, BaseModel):
+            value = value.model_json_schema()
+        fields[name] = value
+    # Anything not JSON-serializable falls back to repr(): at worst a cache miss
+    return hashlib.sha256(json.dumps(fields, sort_keys=True, default=repr).encode("utf-8")).hexdigest()
+
+def _cache_path(model_id: str, prompt: str, config: types.GenerateContentConfig | None = None) -> Path:
+    material = f"{model_id}\0{prompt}"
+    if config is not None:
+        # A structured (JSON schema) answer must never be served to a plain-text request
+        material += f"\0{_config_digest(config)}"
+    key = hashlib.sha256(material.encode("utf-8")).hexdigest()
+    return LLM_CACHE_DIR / f"{key}.json"
+
+def _cache_get(model_id: str, prompt: str, ttl: float,
+               config: types.GenerateContentConfig | None = None) -> str | None:
+    path = _cache_path(model_id, prompt, config)
+    try:
+        entry = json.loads(path.read_text())
+    except (OSError, ValueError):
+        return None
+    if time.time() - entry.get("created", 0) > ttl or not entry.get("text"):
+        return None
+    os.utime(path)  # LRU: mark as recently used
+    return entry["text"]
+
+def _cache_put(model_id: str, prompt: str, text: str,
+               config: types.GenerateContentConfig | None = None):
+    try:
+        atomic_write(_cache_path(model_id, prompt, config),
+                     json.dumps({"model": model_id, "created": time.time(), "text": text}))
+        evict_lru(LLM_CACHE_DIR, "*.json", LLM_CACHE_MAX_BYTES)
+    except OSError as e:
+        print(f"⚠️ Could not cache Gemini response: {e}")
+
+def _is_valid(text: str, validate: Callable[[str], object] | None) -> bool:
+    if validate is None:
+        return True
+    try:
+        validate(text)
+        return True
+    except Exception:
+        return False
+
+def _cached_response(prompt: str, cache_ttl: float | None,
+                     config: types.GenerateContentConfig | None = None,
+                     validate: Callable[[str], object] | None = None) -> str | None:
+    if not cache_ttl:
+        return None
     for model_id in FALLBACK_MODELS:
-        try:
-            response = client.models.generate_content(
-                model=model_id,
-                contents=prompt
-            )
-            return response.text
-        except Exception as e:
-            err_msg = str(e)
-            if "503" in err_msg or "UNAVAILABLE" in err_msg:
-                print(f"⚠️ {model_id} returned 503. Retrying with next model...")
-                continue
-            else:
-                print(f"Gemini request failed on {model_id}: {e}")
-                return ""
+        cached = _cache_get(model_id, prompt, cache_ttl, config)
+        if cached and _is_valid(cached, validate):
+            print(f"Using cached {model_id} response.")
+            return cached
+    return None
+
+def _store_response(model_id: str, prompt: str, text: str | None, cache_ttl: float | None,
+                    config: types.GenerateContentConfig | None = None,
+                    validate: Callable[[str], object] | None = None):
+    # Failures, empty answers and answers the caller cannot use are never cached
+    if not (cache_ttl and text and text.strip()):
+        return
+    if not _is_valid(text, validate):
+        print(f"⚠️ {model_id} response failed validation, not caching it.")
+        return
+    _cache_put(model_id, prompt, text, config)
+
+def _handle_failure(model_id: str, attempt: int, started: float, e: Exception) -> str:
+    """Record a failed call and decide what to do next: "retry", "next" or "abort"."""
+    kind = model_health.classify_error(e)
+    if kind == "fatal":
+        # The request itself is bad; not the model's fault
+        print(f"Gemini request failed on {model_id}: {e}")
+        return "abort"
+
+    model_health.record_failure(model_id, time.monotonic() - started, e)
+    if kind == "transient" and attempt < model_health.RETRY_ATTEMPTS:
+        print(f"⚠️ {model_id} failed ({e}), retrying ({attempt}/{model_health.RETRY_ATTEMPTS})...")
+        return "retry"
+    if kind == "unavailable":
+        print(f"⚠️ {model_id} returned 503. Retrying with next model...")
+    else:
+        print(f"⚠️ {model_id} failed ({e}). Retrying with next model...")
+    return "next"
+
+# Basic LLM Request Helper
+def gpt_request(prompt: str, cache_ttl: float | None = None,
+                config: types.GenerateContentConfig | None = None,
+                validate: Callable[[str], object] | None = None) -> str:
+    """
+    Send a prompt to Gemini, routing to the healthiest model first and
+    cascading through FALLBACK_MODELS; transient errors are retried with
+    jittered backoff. With `cache_ttl` (seconds), a response to the same
+    prompt from the same model that is younger than that is reused instead
+    of calling the API. `config` is passed through (e.g. for structured output)
+    and is part of the cache key. `validate(text)` must not raise for a
+    response to be cached (e.g. a JSON schema parse).
+    """
+    cached = _cached_response(prompt, cache_ttl, config, validate)
+    if cached:
+        return cached
+
+    for model_id in model_health.route(FALLBACK_MODELS):
+        for attempt in range(1, model_health.RETRY_ATTEMPTS + 1):
+            started = time.monotonic()
+            try:
+                response = client.models.generate_content(
+                    model=model_id,
+                    contents=prompt,
+                    config=config
+                )
+                model_health.record_success(model_id, time.monotonic() - started)
+                _store_response(model_id, prompt, response.text, cache_ttl, config, validate)
+                return response.text
+            except Exception as e:
+                action = _handle_failure(model_id, attempt, started, e)
+                if action == "abort":
+                    return ""
+                if action == "next":
+                    break
+                time.sleep(model_health.backoff_delay(attempt))
     
     print("❌ All Gemini models failed.")
     return ""
 
+async def gpt_request_async(prompt: str, cache_ttl: float | None = None,
+                            config: types.GenerateContentConfig | None = None) -> str:
+    """Async `gpt_request` (same routing, retries and cache), for issuing independent prompts concurrently."""
+    cached = _cached_response(prompt, cache_ttl, config)
+    if cached:
+        return cached
+
+    for model_id in model_health.route(FALLBACK_MODELS):
+        for attempt in range(1, model_health.RETRY_ATTEMPTS + 1):
+            started = time.monotonic()
+            try:
+                response = await client.aio.models.generate_content(
+                    model=model_id,
+                    contents=prompt,
+                    config=config
+                )
+                model_health.record_success(model_id, time.monotonic() - started)
+                _store_response(model_id, prompt, response.text, cache_ttl, config)
+                return response.text
+            except Exception as e:
+                action = _handle_failure(model_id, attempt, started, e)
+                if action == "abort":
+                    return ""
+                if action == "next":
+                    break
+                await asyncio.sleep(model_health.backoff_delay(attempt))
+
+    print("❌ All Gemini models failed.")
+    return ""
+
+class StreamBrokenError(RuntimeError):
+    """A streamed Gemini response failed after part of it was already consumed."""
+
+def stream_gpt_request(prompt: str, cache_ttl: float | None = None) -> Iterator[str]:
+    """
+    Streaming `gpt_request`: yields text as Gemini generates it. Models are
+    routed and cascaded like `gpt_request` until the first text arrives;
+    a failure after that raises StreamBrokenError, since the partial output
+    is already consumed.
+    The complete response is cached like `gpt_request` would.
+    """
+    cached = _cached_response(prompt, cache_ttl)
+    if cached:
+        yield cached
+        return
+
+    for model_id in model_health.route(FALLBACK_MODELS):
+        for attempt in range(1, model_health.RETRY_ATTEMPTS + 1):
+            started = time.monotonic()
+            pieces = []
+            try:
+                for part in client.models.generate_content_stream(
+                    model=model_id,
+                    contents=prompt
+                ):
+                    if part.text:
+                        pieces.append(part.text)
+                        yield part.text
+                model_health.record_success(model_id, time.monotonic() - started)
+                _store_response(model_id, prompt, "".join(pieces), cache_ttl)
+                return
+            except Exception as e:
+                if pieces:
+                    model_health.record_failure(model_id, time.monotonic() - started, e)
+                    raise StreamBrokenError(f"Gemini stream from {model_id} broke off: {e}") from e
+                action = _handle_failure(model_id, attempt, started, e)
+                if action == "abort":
+                    return
+                if action == "next":
+                    break
+                time.sleep(model_health.backoff_delay(attempt))
+
+    print("❌ All Gemini models failed.")
+
+def run_concurrently(*coroutines) -> list:
+    """
+    Run independent async LLM calls concurrently from synchronous code; the
+    whole batch takes as long as the slowest call. Exceptions are returned
+    in place of results rather than raised.
+    """
+    async def gather():
+        return await asyncio.gather(*coroutines, return_exceptions=True)
+    return asyncio.run(gather())
+
 # Format Story
-def format_story_with_gpt(ai_input: str) -> str:
+def format_story_with_gpt(ai_input: str, cache_ttl: float | None = STORY_CACHE_TTL) -> str:
     """Send story text to Gemini for conversational narration formatting."""
     prompt = f"""
     {ai_input}
     """
     try:
-        return gpt_request(prompt)
+        return gpt_request(prompt, cache_ttl=cache_ttl)
     except Exception as e:
         print(f"Error formatting story with Gemini: {e}")
         return ""
 
+def stream_story_with_gpt(ai_input: str, cache_ttl: float | None = STORY_CACHE_TTL) -> Iterator[str]:
+    """Streaming `format_story_with_gpt`, for feeding TTS while the script is written."""
+    prompt = f"""
+    {ai_input}
+    """
+    yield from stream_gpt_request(prompt, cache_ttl=cache_ttl)
+
 def extract_between(text: str, start_key: str, end_key: str) -> str:
     try:
         start = text.index(start_key) + len(start_key)
@@ -64,16 +281,8 @@ def extract_between(text: str, start_key: str, end_key: str) -> str:
     except ValueError:
         return ""
 
-def generate_youtube_metadata(original_title: str, story_text: str,
-                              subreddit: str, url: str):
-    """
-    Produces SEO-friendly:
-    - YouTube title
-    - Description
-    - Tags list
-    """
-
-    prompt = f"""
+def _metadata_prompt(original_title: str, story_text: str, subreddit: str, url: str) -> str:
+    return f"""
 You are generating metadata for a YouTube video narrated from a Reddit story.
 
 Original Reddit Title:
@@ -97,37 +306,129 @@ TAGS:
 <tag1, tag2, tag3, ... up to 12 tags>
 """
 
-    try:
-        response = gpt_request(prompt)
+def _parse_metadata(response: str, original_title: str, subreddit: str, url: str):
+    title = extract_between(response, "TITLE:", "DESCRIPTION:")
+    description = extract_between(response, "DESCRIPTION:", "TAGS:")
+    tags_line = response.split("TAGS:")[-1].strip()
 
-        title = extract_between(response, "TITLE:", "DESCRIPTION:")
-        description = extract_between(response, "DESCRIPTION:", "TAGS:")
-        tags_line = response.split("TAGS:")[-1].strip()
+    tags = [t.strip() for t in tags_line.split(",") if t.strip()]
 
-        tags = [t.strip() for t in tags_line.split(",") if t.strip()]
+    if not title:
+        title = original_title[:80]
 
-        if not title:
-            title = original_title[:80]
+    if not description:
+        description = f"Story from r/{subreddit}\nOriginal post: {url}"
 
-        if not description:
-            description = f"Story from r/{subreddit}\nOriginal post: {url}"
+    if not tags:
+        tags = ["reddit stories", "narration", "storytime"]
 
-        if not tags:
-            tags = ["reddit stories", "narration", "storytime"]
+    return title, description, tags
 
-        return title, description, tags
+def _fallback_metadata(original_title: str, subreddit: str, url: str):
+    return (
+        original_title[:80],
+        f"Story from r/{subreddit}\nOriginal: {url}",
+        ["reddit", "storytime", "shorts"]
+    )
+
+def generate_youtube_metadata(original_title: str, story_text: str,
+                              subreddit: str, url: str,
+                              cache_ttl: float | None = METADATA_CACHE_TTL):
+    """
+    Produces SEO-friendly:
+    - YouTube title
+    - Description
+    - Tags list
+    """
+    prompt = _metadata_prompt(original_title, story_text, subreddit, url)
+
+    try:
+        response = gpt_request(prompt, cache_ttl=cache_ttl)
+        return _parse_metadata(response, original_title, subreddit, url)
 
     except Exception as e:
         print("⚠️ Gemini metadata generation failed:", e)
-        return (
-            original_title[:80],
-            f"Story from r/{subreddit}\nOriginal: {url}",
-            ["reddit", "storytime", "shorts"]
-        )
+        return _fallback_metadata(original_title, subreddit, url)
 
-from pydantic import BaseModel
-from google.genai import types
-import time
+async def generate_youtube_metadata_async(original_title: str, story_text: str,
+                                          subreddit: str, url: str,
+                                          cache_ttl: float | None = METADATA_CACHE_TTL):
+    """Async `generate_youtube_metadata`."""
+    prompt = _metadata_prompt(original_title, story_text, subreddit, url)
+
+    try:
+        response = await gpt_request_async(prompt, cache_ttl=cache_ttl)
+        return _parse_metadata(response, original_title, subreddit, url)
+
+    except Exception as e:
+        print("⚠️ Gemini metadata generation failed:", e)
+        return _fallback_metadata(original_title, subreddit, url)
+
+# Structured output: script, metadata and music prompt in one call
+class StoryPackage(BaseModel):
+    script: str = Field(description="The narration script, ready to be read aloud")
+    youtube_title: str = Field(description="SEO-friendly YouTube title, under 100 characters")
+    youtube_description: str = Field(description="2-3 paragraph YouTube description")
+    tags: list[str] = Field(description="Up to 12 YouTube tags")
+    music_prompt: str = Field(description="Background music generation prompt, under 200 words")
+    music_mood: str = Field(default="", description="Background music mood: calm, balanced or energetic")
+
+def _story_package_prompt(ai_input: str, original_title: str, subreddit: str, url: str, video_type: str) -> str:
+    return f"""
+{ai_input}
+
+Return a JSON object with these fields:
+
+script: the narration script written according to the instructions above.
+
+youtube_title, youtube_description, tags: metadata for a YouTube video narrated
+from this story (original Reddit title: "{original_title}", subreddit: r/{subreddit},
+post URL: {url}). The description is 2-3 paragraphs; give up to 12 tags.
+
+music_prompt: a detailed music generation prompt for Google Lyria 3 Pro for this
+{video_type} video. Specify genre, instruments and tempo, start with a strong hook,
+build tension in the middle and end satisfyingly or loopably, match the emotion of
+the script, and keep it strictly under 200 words.
+
+music_mood: one word for the background music energy, exactly one of calm,
+balanced or energetic; used to pick local music when no track is generated.
+"""
+
+def generate_story_package(ai_input: str, original_title: str, subreddit: str, url: str,
+                           video_type: str = "Reddit Story",
+                           cache_ttl: float | None = STORY_CACHE_TTL) -> StoryPackage | None:
+    """
+    One structured-output request for the narration script, YouTube metadata
+    and music prompt. Returns None if the response is unusable, so callers can
+    fall back to `format_story_with_gpt` / `generate_youtube_metadata` /
+    `generate_music_prompt`.
+    """
+    prompt = _story_package_prompt(ai_input, original_title, subreddit, url, video_type)
+    config = types.GenerateContentConfig(
+        response_mime_type="application/json",
+        response_schema=StoryPackage
+    )
+    try:
+        response = gpt_request(prompt, cache_ttl=cache_ttl, config=config,
+                               validate=StoryPackage.model_validate_json)
+        if not response:
+            return None
+        package = StoryPackage.model_validate_json(response)
+    except Exception as e:
+        print(f"⚠️ Structured story request failed, using separate requests: {e}")
+        return None
+
+    if not package.script.strip():
+        return None
+
+    # Same fallbacks as the TITLE:/DESCRIPTION:/TAGS: parser
+    title, description, tags = _parse_metadata("", original_title, subreddit, url)
+    package.youtube_title = package.youtube_title.strip() or title
+    package.youtube_description = package.youtube_description.strip() or description
+    package.tags = [t.strip() for t in package.tags if t.strip()][:12] or tags
+    package.music_prompt = package.music_prompt.strip()
+    package.music_mood = package.music_mood.strip().lower()
+    return package
 
 class WordTimestamp(BaseModel):
     word: str
@@ -140,58 +441,18 @@ def transcribe_audio_with_timestamps(audio_path: str):
     Groups words into 3-4 word chunks for better subtitle readability.
     """
     try:
-        from faster_whisper import WhisperModel
-        print(f"Loading local Whisper model (tiny.en) for transcription...")
-        
-        # tiny.en is extremely fast and accurate enough for clear TTS audio
-        model = WhisperModel("tiny.en", device="cpu", compute_type="int8")
-        
+        from core.transcriber import transcribe_words
+
+        # Served by the warm transcriber worker when running, else loaded once in-process
         print(f"Transcribing {audio_path}...")
-        segments, info = model.transcribe(audio_path, word_timestamps=True)
-        
-        # Flatten words
-        words = []
-        for segment in segments:
-            for word in segment.words:
-                words.append({
-                    "word": word.word.strip(),
-                    "start": word.start,
-                    "end": word.end
-                })
+        words = transcribe_words(audio_path)
         
         if not words:
             return []
             
         # Group into 3-4 word chunks to make reading easier
-        chunks = []
-        current_chunk = []
-        current_start = None
-        
-        for w in words:
-            if current_start is None:
-                current_start = w["start"]
-            
-            current_chunk.append(w["word"])
-            
-            # Break chunk at 3 words OR if there's heavy punctuation
-            if len(current_chunk) >= 3 or w["word"].endswith((".", "?", "!", ",")):
-                chunks.append({
-                    "word": " ".join(current_chunk),
-                    "start": current_start,
-                    "end": w["end"]
-                })
-                current_chunk = []
-                current_start = None
-                
-        # Append any remaining words
-        if current_chunk:
-            chunks.append({
-                "word": " ".join(current_chunk),
-                "start": current_start,
-                "end": words[-1]["end"]
-            })
-            
-        return chunks
+        from core.engine.subtitles import group_words
+        return group_words(words)
         
     except Exception as e:
         print(f"Error transcribing audio with Whisper: {e}")
@@ -0,0 +1,181 @@
+"""
+Health tracking and routing for the Gemini model cascade.
+
+Every request outcome updates a per-model EWMA of error rate and latency,
+which order the cascade (error rate first, latency as the tiebreaker), and
+a circuit breaker: after FAILURE_THRESHOLD consecutive failures a model is
+skipped (tried only as a last resort) for OPEN_SECONDS, then a single
+half-open probe request decides whether it closes again. State is shared
+between pipeline runs through data/llm_health.json, so a model that has
+been failing for an hour is not retried first by every new process.
+"""
+
+import json
+import math
+import time
+import random
+import threading
+from pathlib import Path
+from core.utils.common import atomic_write, file_lock
+
+try:
+    from google.genai.errors import APIError
+except ImportError:  # Only needed to classify errors raised by the genai client
+    APIError = None
+
+HEALTH_FILE = Path("data/llm_health.json")
+HEALTH_LOCK = Path("data/.locks/llm_health.lock")
+
+EWMA_ALPHA = 0.3
+FAILURE_THRESHOLD = 3   # consecutive failures that open the circuit
+OPEN_SECONDS = 300      # how long an open circuit sheds traffic before a probe
+PROBE_TIMEOUT = 120     # a probe that never reported back is abandoned after this
+ERROR_HALF_LIFE = 600   # idle models drift back to their configured preference
+LATENCY_BUCKET = 2.0    # seconds; latency differences below this do not reorder models
+
+RETRY_ATTEMPTS = 3      # per model, for transient (non-503) errors
+BACKOFF_BASE = 1.0      # seconds, doubled per attempt and jittered
+
+# Thread lock for this process, file lock for the pipelines sharing HEALTH_FILE
+_lock = threading.Lock()
+
+
+def classify_error(e: Exception) -> str:
+    """
+    "unavailable": the model is overloaded, move on to the next one.
+    "transient":   rate limits, timeouts, 5xx, dropped connections; retry.
+    "model":       the model itself is gone (404); move on.
+    "fatal":       the request is bad; no model will accept it.
+    """
+    if APIError is not None and isinstance(e, APIError):
+        code = e.code or 0
+        if code == 503:
+            return "unavailable"
+        if code == 404:
+            return "model"
+        if code in (408, 429) or code >= 500:
+            return "transient"
+        return "fatal"
+    # Transport failures below the API (httpx ConnectError / ReadTimeout, sockets)
+    if isinstance(e, (ConnectionError, TimeoutError)):
+        return "transient"
+    if any(kind in type(e).__name__ for kind in ("Timeout", "ConnectError", "RemoteProtocolError")):
+        return "transient"
+    return "fatal"
+
+
+def backoff_delay(attempt: int) -> float:
+    """Full-jitter exponential backoff."""
+    return random.uniform(0, BACKOFF_BASE * 2 ** attempt)
+
+
+def _load() -> dict:
+    try:
+        return json.loads(HEALTH_FILE.read_text())
+    except (OSError, ValueError):
+        return {}
+
+
+def _save(state: dict):
+    try:
+        atomic_write(HEALTH_FILE, json.dumps(state, indent=2))
+    except OSError:
+        pass
+
+
+def _new_health() -> dict:
+    return {
+        "latency": None,
+        "error_rate": 0.0,
+        "consecutive_failures": 0,
+        "opened_at": None,
+        "probe_started": None,
+        "last_error": None,
+        "updated": None,
+    }
+
+
+def _current_error_rate(health: dict, now: float) -> float:
+    """EWMA error rate, decayed by time since the model was last used."""
+    idle = now - (health.get("updated") or now)
+    return health["error_rate"] * 0.5 ** (idle / ERROR_HALF_LIFE)
+
+
+def route(models: list[str]) -> list[str]:
+    """
+    Order `models` for a request: a half-open probe when a circuit's cooldown
+    has passed, then healthy models by error rate, latency and finally their
+    configured preference, and models with open circuits last as a last resort.
+    """
+    now = time.time()
+    with _lock, file_lock(HEALTH_LOCK):
+        state = _load()
+        healthy, probes, open_ = [], [], []
+        for preference, model_id in enumerate(models):
+            health = state.get(model_id) or _new_health()
+            opened_at = health.get("opened_at")
+            if opened_at is None:
+                # Bucketed so noise does not reshuffle the cascade; unmeasured latency sorts last
+                latency = health.get("latency")
+                healthy.append((
+                    round(_current_error_rate(health, now), 1),
+                    math.inf if latency is None else int(latency // LATENCY_BUCKET),
+                    preference,
+                    model_id,
+                ))
+            elif now - opened_at >= OPEN_SECONDS and (
+                not health.get("probe_started") or now - health["probe_started"] > PROBE_TIMEOUT
+            ):
+                # Half-open: let exactly one request through to test the model
+                health["probe_started"] = now
+                state[model_id] = health
+                probes.append((preference, model_id))
+            else:
+                open_.append((opened_at, model_id))
+
+        if probes:
+            _save(state)
+
+    # A probe goes first: if it fails, the request just falls through to a healthy model
+    return ([m for _, m in probes]
+            + [m for *_, m in sorted(healthy)]
+            + [m for _, m in sorted(open_)])
+
+
+def record_success(model_id: str, latency: float):
+    with _lock, file_lock(HEALTH_LOCK):
+        state = _load()
+        health = state.get(model_id) or _new_health()
+        if health.get("opened_at") is not None:
+            print(f"[LLM] {model_id} recovered, closing circuit.")
+        health["latency"] = latency if health["latency"] is None else (
+            EWMA_ALPHA * latency + (1 - EWMA_ALPHA) * health["latency"])
+        now = time.time()
+        health["error_rate"] = (1 - EWMA_ALPHA) * _current_error_rate(health, now)
+        health.update(consecutive_failures=0, opened_at=None, probe_started=None, updated=now)
+        state[model_id] = health
+        _save(state)
+
+
+def record_failure(model_id: str, latency: float, error: Exception):
+    with _lock, file_lock(HEALTH_LOCK):
+        state = _load()
+        health = state.get(model_id) or _new_health()
+        health["latency"] = latency if health["latency"] is None else (
+            EWMA_ALPHA * latency + (1 - EWMA_ALPHA) * health["latency"])
+        now = time.time()
+        health["error_rate"] = EWMA_ALPHA + (1 - EWMA_ALPHA) * _current_error_rate(health, now)
+        health["updated"] = now
+        health["consecutive_failures"] += 1
+        health["last_error"] = str(error)[:200]
+
+        probing = health.get("probe_started") is not None
+        if probing or health["consecutive_failures"] >= FAILURE_THRESHOLD:
+            if health.get("opened_at") is None or probing:
+                print(f"[LLM] Opening circuit for {model_id} for {OPEN_SECONDS}s "
+                      f"({health['consecutive_failures']} consecutive failures).")
+            health["opened_at"] = now
+            health["probe_started"] = None
+        state[model_id] = health
+        _save(state)
+
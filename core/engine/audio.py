@@ -1,27 +1,65 @@
 # ./utilities/tts_generator.py
 
+import os
 import json
 import random
-import re
+import time
+import hashlib
+import struct
+import wave
+import tempfile
+import threading
 from pathlib import Path
+from typing import Iterable
+from concurrent.futures import ThreadPoolExecutor, Future
 import pickle
 from google.cloud import texttospeech
+from google.api_core import exceptions as google_exceptions
 from google_auth_oauthlib.flow import InstalledAppFlow
 from google.auth.transport.requests import Request
 from google.oauth2.credentials import Credentials
 from datetime import datetime
-from core.utils.common import get_now
+from core.engine.gpu import audio_encoder_args
+from core.engine.ffmpeg_runner import run_ffmpeg
+from core.engine import tts_usage
+from core.engine.text_chunks import chunk_text, stream_chunks
+from core.utils.common import atomic_write, evict_lru
+from core.engine.subtitles import align_script, save_word_timings, MIN_ALIGN_CONFIDENCE
 
 SCOPES = ["https://www.googleapis.com/auth/cloud-platform"]
 OAUTH_SECRETS = Path("secrets/client_secrets.json")
 OAUTH_TOKEN = Path("secrets/tts_token.pickle")
 
-def get_tts_client() -> texttospeech.TextToSpeechClient:
-    """Returns a TTS client using OAuth credentials."""
+# Pooled clients are keyed by token file; tokens are refreshed this long before expiry
+TOKEN_REFRESH_MARGIN = 300
+TOKEN_RETRY_INTERVAL = 60
+_client_pool: dict[str, tuple[texttospeech.TextToSpeechClient, Credentials]] = {}
+_client_lock = threading.Lock()
+
+DEFAULT_TTS_CONCURRENCY = 4
+TTS_MAX_ATTEMPTS = 4
+TTS_BACKOFF_BASE = 1.0  # seconds, doubled per attempt and jittered
+
+# Synthesized LINEAR16 chunks, reused when a run is retried
+TTS_CACHE_DIR = Path("data/tts_cache")
+TTS_CACHE_MAX_BYTES = 512 * 1024 * 1024
+
+# Transient errors worth retrying; anything else (bad voice, invalid text...) fails fast
+RETRYABLE_TTS_ERRORS = (
+    google_exceptions.ServiceUnavailable,
+    google_exceptions.DeadlineExceeded,
+    google_exceptions.TooManyRequests,
+    google_exceptions.ResourceExhausted,
+    google_exceptions.InternalServerError,
+    ConnectionError,
+)
+
+def _load_tts_credentials(token_path: Path = OAUTH_TOKEN) -> Credentials:
+    """Loads OAuth credentials from `token_path`, refreshing or re-authenticating as needed."""
     creds = None
-    if OAUTH_TOKEN.exists():
+    if token_path.exists():
         try:
-            with open(OAUTH_TOKEN, "rb") as f:
+            with open(token_path, "rb") as f:
                 creds = pickle.load(f)
         except Exception:
             creds = None
@@ -55,10 +93,64 @@ def get_tts_client() -> texttospeech.TextToSpeechClient:
                 prompt='consent'
             )
 
-        with open(OAUTH_TOKEN, "wb") as f:
-            pickle.dump(creds, f)
+        _save_tts_credentials(creds, token_path)
+
+    return creds
+
+def _save_tts_credentials(creds: Credentials, token_path: Path):
+    atomic_write(token_path, pickle.dumps(creds), mode=0o600)
+
+def _seconds_until_refresh(creds: Credentials) -> float:
+    if not creds.expiry:
+        return TOKEN_RETRY_INTERVAL
+    # google-auth stores expiry as naive UTC
+    remaining = (creds.expiry - datetime.utcnow()).total_seconds()
+    return max(0.0, remaining - TOKEN_REFRESH_MARGIN)
+
+def _token_refresher(token_path: Path, creds: Credentials):
+    """
+    Refreshes the pooled credentials in place shortly before they expire, so
+    in-flight gRPC calls never block on a synchronous refresh.
+    """
+    key = str(token_path.resolve())
+    while True:
+        time.sleep(_seconds_until_refresh(creds))
+        with _client_lock:
+            if _client_pool.get(key, (None, None))[1] is not creds:
+                return  # Client was replaced or dropped
+        try:
+            creds.refresh(Request())
+            _save_tts_credentials(creds, token_path)
+            print("🔄 TTS token refreshed in background.")
+        except Exception as e:
+            if creds.expired:
+                # Refresh token revoked or unusable: rebuild on next request
+                print(f"❌ Background TTS token refresh failed ({e}); dropping pooled client.")
+                with _client_lock:
+                    if _client_pool.get(key, (None, None))[1] is creds:
+                        _client_pool.pop(key, None)
+                return
+            print(f"⚠️ Background TTS token refresh failed ({e}), retrying.")
+        if _seconds_until_refresh(creds) <= 0:
+            time.sleep(TOKEN_RETRY_INTERVAL)
+
+def get_tts_client(token_path: Path = OAUTH_TOKEN) -> texttospeech.TextToSpeechClient:
+    """
+    Returns the process-wide TTS client for `token_path`, creating it (and its
+    background token refresher) on first use so later runs reuse a warm channel.
+    """
+    key = str(token_path.resolve())
+    with _client_lock:
+        pooled = _client_pool.get(key)
+        if pooled and pooled[1].valid:
+            return pooled[0]
+
+        creds = _load_tts_credentials(token_path)
+        client = texttospeech.TextToSpeechClient(credentials=creds)
+        _client_pool[key] = (client, creds)
 
-    return texttospeech.TextToSpeechClient(credentials=creds)
+    threading.Thread(target=_token_refresher, args=(token_path, creds), daemon=True).start()
+    return client
 
 def update_json_usage(config_path: Path, new_usage: int, current_month: str):
     """Updates the JSON configuration file with new usage stats in module.local.json."""
@@ -74,85 +166,186 @@ def update_json_usage(config_path: Path, new_usage: int, current_month: str):
     except Exception as e:
         print(f"Error updating config usage: {e}")
 
-def chunk_text(text: str, max_chars: int = 600) -> list[str]:
-    """
-    Splits text into chunks respecting sentence boundaries to avoid 
-    Google TTS 'Sentence too long' errors.
-    """
-    # Split by sentence endings (. ? ! or newlines)
-    # The regex keeps the punctuation with the sentence
-    sentences = re.split(r'(?<=[.?!])\s+|\n+', text)
-    
-    chunks = []
-    current_chunk = ""
+def _tts_cache_key(voice_name: str, lang_code: str, audio_config, chunk: str) -> str:
+    """Cache key covering everything that changes the synthesized audio."""
+    material = json.dumps([
+        voice_name,
+        lang_code,
+        texttospeech.AudioConfig.to_json(audio_config),
+        hashlib.sha256(chunk.encode("utf-8")).hexdigest(),
+    ])
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
 
-    for sentence in sentences:
-        if not sentence.strip():
-            continue
-            
-        # If adding this sentence exceeds max_chars, push current_chunk and start new
-        if len(current_chunk) + len(sentence) > max_chars:
-            if current_chunk:
-                chunks.append(current_chunk.strip())
-            current_chunk = sentence
-        else:
-            current_chunk += " " + sentence
-
-    if current_chunk:
-        chunks.append(current_chunk.strip())
-        
-    return chunks
+def _tts_cache_get(key: str) -> bytes | None:
+    path = TTS_CACHE_DIR / f"{key}.wav"
+    try:
+        data = path.read_bytes()
+        os.utime(path)  # LRU: mark as recently used
+        return data
+    except OSError:
+        return None
 
-def generate_tts(text: str, output_file: Path, TTS_VOICES: list, TTS_CHARACTER_LIMIT: int, config_path: Path) -> Path:
+def _tts_cache_put(key: str, audio_content: bytes):
+    try:
+        atomic_write(TTS_CACHE_DIR / f"{key}.wav", audio_content)
+    except OSError as e:
+        print(f"⚠️ Could not cache TTS chunk: {e}")
+
+def _parse_wav(audio_content: bytes) -> tuple[tuple[int, int, int], bytes]:
     """
-    Generate TTS using Google's Chirp 3 models.
-    Handles Usage logic and Chunks text to avoid API errors.
+    Split a LINEAR16 response into ((channels, sample_rate, sample_width), pcm).
+    Walks the RIFF chunks directly so a bogus or streaming-style data length
+    (0 / 0xFFFFFFFF) just means "to the end of the payload".
     """
-    
-    # 1. Load current usage
-    from core.utils.common import load_module_config
-    module_dir = config_path.parent
-    config_data = load_module_config(module_dir)
-    settings = config_data.get('settings', {})
-    
-    used = settings.get("Reddit_TTS_USAGE-integerNS", 0)
-    saved_month = settings.get("Reddit_TTS_Month-stringNS", "")
-    current_month = get_now().strftime("%Y-%m")
-    
-    # Safety fallback for limit if None
-    if TTS_CHARACTER_LIMIT is None:
-        TTS_CHARACTER_LIMIT = 150000
+    if audio_content[:4] != b"RIFF" or audio_content[8:12] != b"WAVE":
+        # Headerless PCM: Chirp 3 HD default format
+        return (1, 24000, 2), audio_content
 
-    if saved_month != current_month:
-        print(f"New month detected ({current_month}). Resetting TTS usage.")
-        used = 0
+    params = None
+    pos = 12
+    while pos + 8 <= len(audio_content):
+        chunk_id = audio_content[pos:pos + 4]
+        size = struct.unpack("<I", audio_content[pos + 4:pos + 8])[0]
+        body = pos + 8
+        if chunk_id == b"fmt ":
+            channels, rate = struct.unpack("<HI", audio_content[body + 2:body + 8])
+            bits = struct.unpack("<H", audio_content[body + 14:body + 16])[0]
+            params = (channels, rate, bits // 8)
+        elif chunk_id == b"data":
+            end = body + size if 0 < size <= len(audio_content) - body else len(audio_content)
+            if params is None:
+                raise ValueError("WAV data chunk before fmt chunk")
+            return params, audio_content[body:end]
+        pos = body + size + (size & 1)
 
-    text_len = len(text)
+    raise ValueError("WAV payload has no data chunk")
 
-    # 2. Check Limits
-    if used + text_len > TTS_CHARACTER_LIMIT:
-        raise RuntimeError(
-            f"❌ TTS request blocked.\n"
-            f"Used this month: {used:,} chars\n"
-            f"Request size: {text_len:,} chars\n"
-            f"Monthly limit: {TTS_CHARACTER_LIMIT:,} chars"
-        )
+def _join_pcm(audio_chunks: list[bytes]) -> tuple[tuple[int, int, int], bytes]:
+    """Strip the per-chunk WAV headers and concatenate the samples in order."""
+    params = None
+    frames = []
+    for i, audio_content in enumerate(audio_chunks):
+        chunk_params, pcm = _parse_wav(audio_content)
+        if params is None:
+            params = chunk_params
+        elif chunk_params != params:
+            raise ValueError(f"TTS chunk {i} format {chunk_params} does not match {params}")
+        frames.append(pcm)
+    return params, b"".join(frames)
 
-    # 3. Setup Client & Voice
-    client = get_tts_client()
-    
+def _write_pcm(pcm: bytes, params: tuple[int, int, int], output_file: Path):
+    """Write joined PCM as WAV directly, or pipe it through a single ffmpeg encode."""
+    channels, rate, width = params
+
+    if output_file.suffix.lower() == ".wav":
+        # Header lengths are computed from the joined payload
+        with wave.open(str(output_file), "wb") as wav:
+            wav.setnchannels(channels)
+            wav.setsampwidth(width)
+            wav.setframerate(rate)
+            wav.writeframes(pcm)
+        return
+
+    if width != 2:
+        raise ValueError(f"Unsupported TTS sample width: {width * 8} bit")
+
+    cmd = [
+        "ffmpeg", "-y", "-hide_banner", "-loglevel", "error",
+        "-f", "s16le", "-ar", str(rate), "-ac", str(channels),
+        "-i", "pipe:0",
+        *audio_encoder_args(output_file),
+        str(output_file)
+    ]
+    run_ffmpeg(
+        cmd,
+        label=f"tts encode {output_file.name}",
+        duration=len(pcm) / (rate * channels * width),
+        input_data=pcm
+    )
+
+def _align_chunk(text: str, audio_content: bytes) -> list[dict] | None:
+    """Word timings for one synthesized chunk: aligned to its text, Whisper if unsure."""
+    try:
+        (channels, rate, width), pcm = _parse_wav(audio_content)
+        if channels == 1 and width == 2:
+            words, confidence = align_script(text, pcm=pcm, sample_rate=rate)
+            if words and confidence >= MIN_ALIGN_CONFIDENCE:
+                return words
+
+        from core.transcriber import transcribe_words
+        with tempfile.NamedTemporaryFile(suffix=".wav") as tmp:
+            tmp.write(audio_content)
+            tmp.flush()
+            return transcribe_words(tmp.name)
+    except Exception as e:
+        print(f"⚠️ Could not time TTS segment words: {e}")
+        return None
+
+def _offset_chunk_words(audio_chunks: list[bytes], futures: list) -> list[dict] | None:
+    """Shift each chunk's word timings by the duration of the chunks before it."""
+    words = []
+    offset = 0.0
+    for audio_content, future in zip(audio_chunks, futures):
+        chunk_words = future.result()
+        if chunk_words is None:
+            return None
+        for w in chunk_words:
+            words.append({
+                "word": w["word"],
+                "start": round(w["start"] + offset, 3),
+                "end": round(w["end"] + offset, 3)
+            })
+        (channels, rate, width), pcm = _parse_wav(audio_content)
+        offset += len(pcm) / (rate * channels * width)
+    return words
+
+def _synthesize_chunk(client, chunk: str, index: int, voice, audio_config) -> bytes:
+    """Synthesizes one chunk, retrying transient errors with jittered exponential backoff."""
+    synthesis_input = texttospeech.SynthesisInput(text=chunk)
+
+    for attempt in range(1, TTS_MAX_ATTEMPTS + 1):
+        try:
+            response = client.synthesize_speech(
+                input=synthesis_input,
+                voice=voice,
+                audio_config=audio_config
+            )
+            return response.audio_content
+        except RETRYABLE_TTS_ERRORS as e:
+            if attempt == TTS_MAX_ATTEMPTS:
+                print(f"⚠️ Error generating chunk {index+1} after {attempt} attempts: {e}")
+                raise
+            delay = random.uniform(0, TTS_BACKOFF_BASE * 2 ** attempt)
+            print(f"⚠️ Chunk {index+1} failed ({e}). Retrying in {delay:.1f}s...")
+            time.sleep(delay)
+        except Exception as e:
+            print(f"⚠️ Error generating chunk {index+1}: {e}")
+            raise
+
+def _usage_scope(config_path: Path) -> str:
+    """Ledger scope for a module (seeded once from the legacy module-config counter)."""
+    from core.utils.common import load_module_config
+    module_dir = config_path.parent
+    scope = module_dir.name
+    settings = load_module_config(module_dir).get('settings', {})
+    tts_usage.import_legacy(
+        scope,
+        settings.get("Reddit_TTS_Month-stringNS", ""),
+        settings.get("Reddit_TTS_USAGE-integerNS", 0)
+    )
+    return scope
+
+def _voice_settings(TTS_VOICES: list, seed_text: str):
+    """Returns (voice_name, lang_code, voice, audio_config) for a script."""
     if isinstance(TTS_VOICES, list) and len(TTS_VOICES) > 0:
-        selected_voice = random.choice(TTS_VOICES).strip()
+        # Seeded by the script so a retried run picks the same voice (and hits the chunk cache)
+        seed = int(hashlib.sha256(seed_text.encode("utf-8")).hexdigest()[:16], 16)
+        selected_voice = random.Random(seed).choice(TTS_VOICES).strip()
     else:
         selected_voice = "en-US-Chirp3-HD-Aoede"
         
     print(f"🎙️ Selected Voice: {selected_voice}")
 
-    ext = output_file.suffix.lower()
-    if ext not in [".mp3", ".wav"]:
-        ext = ".mp3"
-        output_file = output_file.with_suffix(".mp3")
-
     # If the voice name already contains the full identifier (region-model-HD-name), use it directly.
     # Otherwise, assume it's just the name and default to en-US Chirp3.
     if "Chirp" in selected_voice:
@@ -175,68 +368,235 @@ def generate_tts(text: str, output_file: Path, TTS_VOICES: list, TTS_CHARACTER_L
     audio_config = texttospeech.AudioConfig(
         audio_encoding=texttospeech.AudioEncoding.LINEAR16
     )
+    return voice_name, lang_code, voice, audio_config
+
+def _output_path(output_file: Path) -> Path:
+    if output_file.suffix.lower() not in [".mp3", ".wav", ".m4a"]:
+        return output_file.with_suffix(".mp3")
+    return output_file
+
+def _write_output(audio_chunks: list[bytes], output_file: Path, align_pool, chunk_words: dict):
+    """Encode the joined chunks and save the combined word timings."""
+    output_file.parent.mkdir(parents=True, exist_ok=True)
 
-    # 4. Process Chunks (The Fix for "Sentence too long" AND Audio Drift)
-    chunks = chunk_text(text, max_chars=800)
+    if audio_chunks:
+        params, pcm = _join_pcm(audio_chunks)
+        _write_pcm(pcm, params, output_file)
+
+    if align_pool:
+        align_pool.shutdown(wait=True)
+        words = _offset_chunk_words(audio_chunks, [chunk_words[i] for i in range(len(audio_chunks))])
+        if words is not None:
+            save_word_timings(output_file, words)
+            print(f"Word timings ready for {len(words)} words.")
+
+def _finish_usage(config_path: Path, scope: str):
+    # Mirror the ledger total into the module settings for the module page
+    month = tts_usage.current_month()
+    update_json_usage(config_path, tts_usage.monthly_usage(scope, month), month)
+
+def generate_tts(
+    text: str,
+    output_file: Path,
+    TTS_VOICES: list,
+    TTS_CHARACTER_LIMIT: int,
+    config_path: Path,
+    concurrency: int = DEFAULT_TTS_CONCURRENCY,
+    word_timings: bool = False
+) -> Path:
+    """
+    Generate TTS using Google's Chirp 3 models.
+    Handles Usage logic and Chunks text to avoid API errors.
+    Chunks are synthesized `concurrency` at a time; output order is preserved.
+    With `word_timings`, each chunk is aligned to its text as soon as its audio
+    arrives and the combined timings are saved next to `output_file`.
+    """
     
-    print(f"Generating voiceover in {len(chunks)} chunks...")
+    # 1. Usage ledger
+    scope = _usage_scope(config_path)
     
-    import subprocess
-    temp_dir = Path("temp_audio")
-    temp_dir.mkdir(exist_ok=True)
-    temp_files = []
-
-    for i, chunk in enumerate(chunks):
-        if not chunk.strip():
-            continue
-            
-        synthesis_input = texttospeech.SynthesisInput(text=chunk)
-        
-        try:
-            response = client.synthesize_speech(
-                input=synthesis_input,
-                voice=voice,
-                audio_config=audio_config
-            )
-            
-            # Save as temporary WAV to avoid MP3 padding issues
-            chunk_file = temp_dir / f"chunk_{i}.wav"
-            with open(chunk_file, "wb") as f:
-                f.write(response.audio_content)
-                
-            temp_files.append(chunk_file)
-        except Exception as e:
-            print(f"⚠️ Error generating chunk {i+1}: {e}")
-            raise e
+    # Safety fallback for limit if None
+    if TTS_CHARACTER_LIMIT is None:
+        TTS_CHARACTER_LIMIT = 150000
 
-    # 5. Save and Update
-    output_file.parent.mkdir(parents=True, exist_ok=True)
+    # 2. Voice & Audio Config
+    voice_name, lang_code, voice, audio_config = _voice_settings(TTS_VOICES, text)
+    output_file = _output_path(output_file)
+
+    # 3. Look up cached chunks (The Fix for "Sentence too long" AND Audio Drift)
+    chunks = [c for c in chunk_text(text, max_chars=800) if c.strip()]
+    keys = [_tts_cache_key(voice_name, lang_code, audio_config, c) for c in chunks]
+    audio_chunks = [_tts_cache_get(k) for k in keys]
+    missing = [i for i, audio in enumerate(audio_chunks) if audio is None]
+
+    # Only characters we actually send to the API count against the limit
+    text_len = sum(len(chunks[i]) for i in missing)
+
+    # 4. Reserve against the monthly limit (raises if it would be exceeded)
+    reservation = tts_usage.reserve(scope, text_len, TTS_CHARACTER_LIMIT) if text_len else None
+
+    # 5. Synthesize what the cache could not provide
+    print(f"Generating voiceover in {len(chunks)} chunks "
+          f"({len(chunks) - len(missing)} cached, {len(missing)} to synthesize)...")
+
+    billed = 0
+    billed_lock = threading.Lock()
+
+    # Alignment runs beside synthesis so timings are ready when the last chunk lands
+    align_pool = ThreadPoolExecutor(max_workers=2) if word_timings else None
+    chunk_words = {}
+    if align_pool:
+        for i, audio_content in enumerate(audio_chunks):
+            if audio_content is not None:
+                chunk_words[i] = align_pool.submit(_align_chunk, chunks[i], audio_content)
+
+    def synthesize(i: int) -> bytes:
+        nonlocal billed
+        audio_content = _synthesize_chunk(client, chunks[i], i, voice, audio_config)
+        _tts_cache_put(keys[i], audio_content)
+        with billed_lock:
+            billed += len(chunks[i])
+        if align_pool:
+            chunk_words[i] = align_pool.submit(_align_chunk, chunks[i], audio_content)
+        return audio_content
+
+    try:
+        if missing:
+            client = get_tts_client()
+            workers = max(1, min(int(concurrency or DEFAULT_TTS_CONCURRENCY), len(missing)))
+
+            # gRPC clients are thread-safe; map() yields results in submission order
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                for i, audio_content in zip(missing, pool.map(synthesize, missing)):
+                    audio_chunks[i] = audio_content
+            evict_lru(TTS_CACHE_DIR, "*.wav", TTS_CACHE_MAX_BYTES)
+    except BaseException:
+        if align_pool:
+            align_pool.shutdown(wait=False, cancel_futures=True)
+        # Chunks that did synthesize were billed (and cached for the retry)
+        if reservation is not None:
+            if billed:
+                tts_usage.commit(reservation, billed)
+            else:
+                tts_usage.release(reservation)
+        raise
+
+    if reservation is not None:
+        tts_usage.commit(reservation, billed)
     
-    if temp_files:
-        concat_list = temp_dir / "concat_list.txt"
-        with open(concat_list, "w") as f:
-            for tf in temp_files:
-                f.write(f"file '{tf.absolute()}'\n")
-                
-        cmd = [
-            "ffmpeg", "-y", "-hide_banner", "-loglevel", "error",
-            "-f", "concat", "-safe", "0",
-            "-i", str(concat_list),
-            "-c:a", "libmp3lame", "-q:a", "2",
-            str(output_file)
-        ]
-        subprocess.run(cmd, check=True)
-        
-        concat_list.unlink()
-        for f in temp_files:
-            try:
-                f.unlink()
-            except Exception:
-                pass
+    # 6. Save and Update
+    _write_output(audio_chunks, output_file, align_pool, chunk_words)
+    _finish_usage(config_path, scope)
+
+    print(f"TTS generated → {output_file}")
+    print(f"Characters consumed: {billed:,}")
+    return output_file
+
+def generate_tts_stream(
+    text_stream: Iterable[str],
+    output_file: Path,
+    TTS_VOICES: list,
+    TTS_CHARACTER_LIMIT: int,
+    config_path: Path,
+    concurrency: int = DEFAULT_TTS_CONCURRENCY,
+    word_timings: bool = False
+) -> tuple[Path, str]:
+    """
+    Streaming variant of `generate_tts` for text that is still being generated
+    (e.g. a streamed LLM response). Each ~800-character chunk is sent to
+    synthesis as soon as it is complete and reserved against the monthly
+    limit on its own, so the first audio starts with the first LLM output
+    and an over-limit script stops at the chunk that crosses the limit.
+    Returns (output_file, full text).
+    """
+    scope = _usage_scope(config_path)
+    if TTS_CHARACTER_LIMIT is None:
+        TTS_CHARACTER_LIMIT = 150000
+    output_file = _output_path(output_file)
+
+    pieces = []
+
+    def collect():
+        for piece in text_stream:
+            pieces.append(piece)
+            yield piece
+
+    workers = max(1, int(concurrency or DEFAULT_TTS_CONCURRENCY))
+    pool = ThreadPoolExecutor(max_workers=workers)
+    align_pool = ThreadPoolExecutor(max_workers=2) if word_timings else None
+    client = None
+    chunks = []
+    futures: list[Future] = []
+    reservations = {}
+    chunk_words = {}
+    billed = 0
+    billed_lock = threading.Lock()
+
+    def synthesize(i: int, key: str) -> bytes:
+        nonlocal billed
+        try:
+            audio_content = _synthesize_chunk(client, chunks[i], i, voice, audio_config)
+        except BaseException:
+            tts_usage.release(reservations.pop(i))
+            raise
+        _tts_cache_put(key, audio_content)
+        tts_usage.commit(reservations.pop(i), len(chunks[i]))
+        with billed_lock:
+            billed += len(chunks[i])
+        if align_pool:
+            chunk_words[i] = align_pool.submit(_align_chunk, chunks[i], audio_content)
+        return audio_content
+
+    cached = 0
+    try:
+        for i, chunk in enumerate(stream_chunks(collect(), max_chars=800)):
+            if i == 0:
+                # Seeded by the opening chunk: the full script is not known yet
+                voice_name, lang_code, voice, audio_config = _voice_settings(TTS_VOICES, chunk)
+            chunks.append(chunk)
+            key = _tts_cache_key(voice_name, lang_code, audio_config, chunk)
+            audio_content = _tts_cache_get(key)
+
+            if audio_content is not None:
+                cached += 1
+                future = Future()
+                future.set_result(audio_content)
+                if align_pool:
+                    chunk_words[i] = align_pool.submit(_align_chunk, chunk, audio_content)
+            else:
+                # Incremental limit check: raises once this chunk would cross the limit
+                reservations[i] = tts_usage.reserve(scope, len(chunk), TTS_CHARACTER_LIMIT)
+                if client is None:
+                    client = get_tts_client()
+                future = pool.submit(synthesize, i, key)
+            futures.append(future)
+            print(f"Voiceover part {i + 1} queued ({len(chunk)} chars)...")
+
+        audio_chunks = [f.result() for f in futures]
+    except BaseException:
+        pool.shutdown(wait=True, cancel_futures=True)
+        if align_pool:
+            align_pool.shutdown(wait=False, cancel_futures=True)
+        # Parts that never ran give their reservation back
+        for reservation in reservations.values():
+            tts_usage.release(reservation)
+        _finish_usage(config_path, scope)
+        raise
+
+    pool.shutdown(wait=True)
+    if not chunks:
+        # The LLM produced nothing to narrate: let the caller abort
+        if align_pool:
+            align_pool.shutdown(wait=False)
+        _finish_usage(config_path, scope)
+        return output_file, ""
+
+    evict_lru(TTS_CACHE_DIR, "*.wav", TTS_CACHE_MAX_BYTES)
+    print(f"Generated voiceover in {len(chunks)} parts ({cached} cached, {len(chunks) - cached} synthesized).")
 
-    new_usage = used + text_len
-    update_json_usage(config_path, new_usage, current_month)
+    _write_output(audio_chunks, output_file, align_pool, chunk_words)
+    _finish_usage(config_path, scope)
 
     print(f"TTS generated → {output_file}")
-    print(f"Characters consumed: {text_len:,}")
-    return output_file
\ No newline at end of file
+    print(f"Characters consumed: {billed:,}")
+    return output_file, "".join(pieces)
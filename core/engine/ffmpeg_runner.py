@@ -0,0 +1,236 @@
+"""
+Instrumented runner shared by every ffmpeg/ffprobe call in the engines.
+
+`run_ffmpeg` adds `-progress pipe:1`, parses it and prints fps / speed /
+out_time to stdout (which the supervisor streams into the module log and
+the dashboard), keeps one live snapshot per running job in
+data/ffmpeg_progress.json for the footer badges, and records wall time, CPU time and peak RSS per
+job in data/ffmpeg_jobs.jsonl.
+
+`run_probe` is a timed drop-in for `subprocess.run` used for ffprobe and
+the short GPU probe encodes.
+"""
+
+import os
+import json
+import time
+import random
+import threading
+import subprocess
+from pathlib import Path
+from datetime import datetime, timezone
+from core.utils.logger import manage_log_size
+from core.utils.common import atomic_write, file_lock
+
+PROGRESS_FILE = Path("data/ffmpeg_progress.json")
+PROGRESS_LOCK = Path("data/.locks/ffmpeg_progress.lock")
+JOBS_FILE = Path("data/ffmpeg_jobs.jsonl")
+PROGRESS_INTERVAL = 5  # seconds between progress lines per job
+ACTIVE_AFTER = 30      # a progress snapshot older than this no longer counts as running
+
+
+def _now_iso() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+def _is_live(snapshot: dict) -> bool:
+    try:
+        ts = datetime.fromisoformat(snapshot["timestamp"])
+    except (KeyError, TypeError, ValueError):
+        return False
+    return (datetime.now(timezone.utc) - ts).total_seconds() < ACTIVE_AFTER
+
+
+def _read_progress() -> dict[str, dict]:
+    try:
+        return json.loads(PROGRESS_FILE.read_text()).get("jobs", {})
+    except (OSError, ValueError, AttributeError):
+        return {}
+
+
+def _update_progress(job_id: str, snapshot: dict | None):
+    """
+    Set one job's entry in the shared progress file, or remove it with
+    `snapshot=None`. Entries of jobs that stopped reporting (killed runs)
+    are dropped along the way.
+    """
+    try:
+        with file_lock(PROGRESS_LOCK):
+            jobs = {k: v for k, v in _read_progress().items() if k != job_id and _is_live(v)}
+            if snapshot is not None:
+                jobs[job_id] = snapshot
+            atomic_write(PROGRESS_FILE, json.dumps({"jobs": jobs, "timestamp": _now_iso()}))
+    except OSError:
+        pass
+
+
+def _record_job(job: dict):
+    try:
+        JOBS_FILE.parent.mkdir(exist_ok=True)
+        with open(JOBS_FILE, "a", encoding="utf-8") as f:
+            f.write(json.dumps(job) + "\n")
+        if random.random() < 0.1:
+            manage_log_size(JOBS_FILE)
+    except OSError:
+        pass
+
+
+def _wait_with_usage(proc: subprocess.Popen) -> tuple[int, float, float]:
+    """Wait for the child and return (returncode, cpu_seconds, peak_rss_mb)."""
+    if not hasattr(os, "wait4"):  # Windows
+        return proc.wait(), 0.0, 0.0
+
+    _, status, usage = os.wait4(proc.pid, 0)
+    proc.returncode = os.waitstatus_to_exitcode(status)
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    rss = usage.ru_maxrss / (1024 * 1024 if os.uname().sysname == "Darwin" else 1024)
+    return proc.returncode, usage.ru_utime + usage.ru_stime, rss
+
+
+def _parse_out_time(progress: dict) -> float:
+    for key in ("out_time_us", "out_time_ms"):  # both are microseconds in ffmpeg
+        try:
+            return int(progress[key]) / 1_000_000
+        except (KeyError, ValueError):
+            continue
+    return 0.0
+
+
+def _feed_stdin(proc: subprocess.Popen, data: bytes):
+    try:
+        proc.stdin.buffer.write(data)
+    except (BrokenPipeError, OSError):
+        pass  # ffmpeg exited early; its stderr explains why
+    finally:
+        try:
+            proc.stdin.close()
+        except OSError:
+            pass
+
+
+def run_ffmpeg(
+    command: list[str],
+    label: str | None = None,
+    duration: float | None = None,
+    input_data: bytes | None = None
+) -> dict:
+    """
+    Run an ffmpeg command with live progress reporting.
+
+    `duration` (seconds of output expected) enables percentage reporting.
+    `input_data` is streamed to ffmpeg's stdin (for `-i pipe:0` inputs).
+    Raises subprocess.CalledProcessError on failure like `subprocess.run(check=True)`.
+    Returns the job stats dict.
+    """
+    label = label or Path(command[-1]).name
+    cmd = [command[0], "-progress", "pipe:1", "-nostats", *command[1:]]
+
+    start = time.monotonic()
+    proc = subprocess.Popen(
+        cmd,
+        stdin=subprocess.PIPE if input_data is not None else subprocess.DEVNULL,
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, bufsize=1
+    )
+
+    # Listed right away so the job is visible before its first progress report
+    job_id = str(proc.pid)
+    snapshot = {"label": label, "pid": proc.pid, "fps": None, "speed": "", "out_time": 0.0,
+                "percent": 0.0 if duration else None, "timestamp": _now_iso()}
+    _update_progress(job_id, snapshot)
+
+    if input_data is not None:
+        threading.Thread(target=_feed_stdin, args=(proc, input_data), daemon=True).start()
+
+    # Drain stderr on a side thread so a chatty encoder never blocks on a full pipe
+    stderr_lines = []
+    drain = threading.Thread(target=lambda: stderr_lines.extend(proc.stderr), daemon=True)
+    drain.start()
+
+    progress = {}
+    speeds = []
+    last_report = start
+
+    for line in proc.stdout:
+        key, _, value = line.strip().partition("=")
+        if not key:
+            continue
+        progress[key] = value
+        if key != "progress":
+            continue
+
+        out_time = _parse_out_time(progress)
+        speed = progress.get("speed", "").rstrip("x").strip()
+        try:
+            speeds.append(float(speed))
+        except ValueError:
+            pass
+
+        snapshot = {
+            "label": label,
+            "pid": proc.pid,
+            "fps": progress.get("fps"),
+            "speed": speed,
+            "out_time": round(out_time, 1),
+            "percent": round(100 * out_time / duration, 1) if duration else None,
+            "timestamp": _now_iso(),
+        }
+
+        now = time.monotonic()
+        if value == "end" or now - last_report >= PROGRESS_INTERVAL:
+            last_report = now
+            pct = f" {snapshot['percent']}%" if snapshot["percent"] is not None else ""
+            print(f"[FFmpeg] {label}: {snapshot['out_time']}s{pct} @ {snapshot['fps']} fps, {speed}x")
+            _update_progress(job_id, snapshot)
+
+    returncode, cpu_time, peak_rss = _wait_with_usage(proc)
+    drain.join(timeout=5)
+    wall = time.monotonic() - start
+
+    job = {
+        "label": label,
+        "returncode": returncode,
+        "wall_s": round(wall, 2),
+        "cpu_s": round(cpu_time, 2),
+        "peak_rss_mb": round(peak_rss, 1),
+        "avg_speed": round(sum(speeds) / len(speeds), 2) if speeds else None,
+        "out_time": snapshot.get("out_time"),
+        "timestamp": _now_iso(),
+    }
+    _record_job(job)
+    _update_progress(job_id, None)
+
+    stderr = "".join(stderr_lines).strip()
+    if returncode != 0:
+        print(f"[FFmpeg] ❌ {label} failed after {wall:.1f}s: {stderr[-500:]}")
+        raise subprocess.CalledProcessError(returncode, command, stderr=stderr)
+
+    avg = f", avg {job['avg_speed']}x" if job["avg_speed"] else ""
+    print(f"[FFmpeg] ✅ {label} done in {wall:.1f}s (cpu {cpu_time:.1f}s, peak {peak_rss:.0f} MB{avg})")
+    return job
+
+
+def encode_in_progress() -> bool:
+    """True while some process is reporting live progress for an ffmpeg encode."""
+    return any(_is_live(s) for s in _read_progress().values())
+
+
+def run_probe(command: list[str], label: str | None = None, record: bool = True,
+              **kwargs) -> subprocess.CompletedProcess:
+    """
+    Timed `subprocess.run` wrapper for ffprobe and short probe encodes (output is captured as text).
+    `record=False` skips the jobs log, for trivial queries like `ffmpeg -version`.
+    """
+    kwargs.setdefault("capture_output", True)
+    kwargs.setdefault("text", True)
+
+    start = time.monotonic()
+    try:
+        return subprocess.run(command, **kwargs)
+    finally:
+        wall = time.monotonic() - start
+        if record:
+            _record_job({
+                "label": label or command[0],
+                "wall_s": round(wall, 3),
+                "timestamp": _now_iso(),
+            })
@@ -0,0 +1,385 @@
+"""
+Sidecar index for normalized background footage.
+
+Lives next to the `_norm.mp4` files as `.cached/index.json` and stores,
+per source clip, everything the footage selector needs (duration, frame
+count, keyframe positions, codec parameters) so a production run never
+has to spawn ffprobe for clips it has already seen.
+
+Entries are keyed by the raw source file name and are considered stale
+when the source's size or mtime changes, or the cached file disappears.
+The index also memoizes source content hashes (used to build cache keys)
+and tracks when each clip was last used, for LRU eviction. Sources whose
+clip was evicted are remembered so bulk normalization does not immediately
+re-encode them (and evict something else in turn).
+
+Pipelines and the ingest daemon share the file: `save` re-reads it under an
+inter-process lock and merges this process's changes into what is on disk.
+"""
+
+import json
+import time
+import random
+import hashlib
+import threading
+from pathlib import Path
+from core.engine.ffmpeg_runner import run_probe
+from core.utils.common import file_lock, atomic_write
+
+INDEX_NAME = "index.json"
+INDEX_VERSION = 2
+
+# Clips used more recently than this are never evicted (another run may be reading them)
+MIN_EVICT_AGE = 600
+
+# Length range of each randomly placed segment when filling a target duration
+MIN_SEGMENT = 8.0
+MAX_SEGMENT = 20.0
+
+_index_lock = threading.Lock()
+
+
+def probe_media(media_path: Path) -> dict:
+    """
+    Run a single ffprobe over a clip and return its index metadata:
+    duration, frame count, keyframe timestamps and video codec parameters.
+    """
+    res = run_probe(
+        ["ffprobe", "-v", "error", "-select_streams", "v:0",
+         "-show_entries",
+         "format=duration:stream=codec_name,profile,pix_fmt,width,height,"
+         "r_frame_rate,time_base,nb_frames:packet=pts_time,flags",
+         "-of", "json", str(media_path)],
+        label=f"ffprobe {Path(media_path).name}", check=True
+    )
+    data = json.loads(res.stdout or "{}")
+
+    stream = (data.get("streams") or [{}])[0]
+    packets = data.get("packets") or []
+
+    keyframes = sorted(
+        round(float(p["pts_time"]), 3)
+        for p in packets
+        if "K" in p.get("flags", "") and p.get("pts_time") not in (None, "N/A")
+    )
+
+    try:
+        frames = int(stream.get("nb_frames"))
+    except (TypeError, ValueError):
+        frames = len(packets)
+
+    return {
+        "duration": float(data.get("format", {}).get("duration") or 0.0),
+        "frames": frames,
+        "keyframes": keyframes,
+        "keyframe_interval": _uniform_interval(keyframes),
+        "codec": {
+            "codec_name": stream.get("codec_name"),
+            "profile": stream.get("profile"),
+            "pix_fmt": stream.get("pix_fmt"),
+            "width": stream.get("width"),
+            "height": stream.get("height"),
+            "r_frame_rate": stream.get("r_frame_rate"),
+            "time_base": stream.get("time_base"),
+        },
+    }
+
+
+def _uniform_interval(keyframes: list[float], tolerance: float = 0.002) -> float | None:
+    """Return the GOP spacing if keyframes sit on a uniform grid, otherwise None."""
+    if len(keyframes) < 2:
+        return None
+    gaps = [b - a for a, b in zip(keyframes, keyframes[1:])]
+    # The final GOP may be cut short by the end of the clip, ignore it
+    body = gaps[:-1] or gaps
+    interval = body[0]
+    if interval <= 0 or any(abs(g - interval) > tolerance for g in body):
+        return None
+    return round(interval, 3)
+
+
+def hash_file(path: Path, block_size: int = 1024 * 1024) -> str:
+    """Content hash of a file, streamed in blocks."""
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class FootageIndex:
+    """JSON-backed metadata index for a `.cached` footage directory."""
+
+    def __init__(self, cache_dir: Path):
+        self.cache_dir = Path(cache_dir)
+        self.path = self.cache_dir / INDEX_NAME
+        self.lock_path = self.cache_dir / ".locks" / f"{INDEX_NAME}.lock"
+        self.entries: dict[str, dict] = {}
+        self.hashes: dict[str, dict] = {}
+        self.last_used: dict[str, float] = {}
+        self.evicted: dict[str, dict] = {}
+        self._changed: dict[str, set[str]] = {}
+        self._removed: dict[str, set[str]] = {}
+        self._dirty = False
+        self.load()
+
+    # Persistence
+
+    def _read(self) -> dict:
+        if not self.path.exists():
+            return {}
+        try:
+            data = json.loads(self.path.read_text())
+        except Exception:
+            print(f"[FootageIndex] ⚠️ Could not read {self.path}, rebuilding.")
+            data = {}
+        if data.get("version") != INDEX_VERSION:
+            data = {}
+        return data
+
+    def load(self):
+        data = self._read()
+        self.entries = data.get("entries", {})
+        self.hashes = data.get("hashes", {})
+        self.last_used = data.get("last_used", {})
+        self.evicted = data.get("evicted", {})
+
+    def _set(self, table: str, name: str, value):
+        getattr(self, table)[name] = value
+        self._changed.setdefault(table, set()).add(name)
+        self._removed.get(table, set()).discard(name)
+        self._dirty = True
+
+    def _delete(self, table: str, name: str):
+        if getattr(self, table).pop(name, None) is not None:
+            self._removed.setdefault(table, set()).add(name)
+            self._changed.get(table, set()).discard(name)
+            self._dirty = True
+
+    def save(self):
+        """
+        Merge this process's changes into the index on disk and write it
+        atomically. The file lock spans the re-read, so concurrent writers
+        (pipelines, the ingest daemon) never drop each other's updates.
+        """
+        if not self._dirty:
+            return
+        with _index_lock, file_lock(self.lock_path):
+            disk = self._read()
+            merged = {}
+            for table in ("entries", "hashes", "last_used", "evicted"):
+                current = disk.get(table, {})
+                for name in self._removed.get(table, ()):
+                    current.pop(name, None)
+                ours = getattr(self, table)
+                for name in self._changed.get(table, ()):
+                    if name not in ours:
+                        continue
+                    if table == "last_used":
+                        # Most recent use wins
+                        current[name] = max(current.get(name, 0), ours[name])
+                    else:
+                        current[name] = ours[name]
+                merged[table] = current
+
+            atomic_write(self.path, json.dumps({"version": INDEX_VERSION, **merged}))
+
+        self.entries, self.hashes = merged["entries"], merged["hashes"]
+        self.last_used, self.evicted = merged["last_used"], merged["evicted"]
+        self._changed, self._removed = {}, {}
+        self._dirty = False
+
+    # Maintenance
+
+    def hash_known(self, source: Path) -> bool:
+        """True if `source_hash` can answer from the memo without reading the file."""
+        memo = self.hashes.get(source.name)
+        try:
+            stat = source.stat()
+        except OSError:
+            return False
+        return bool(memo) and memo["size"] == stat.st_size and memo["mtime"] == stat.st_mtime
+
+    def source_hash(self, source: Path) -> str:
+        """Content hash of a raw source, recomputed only when its size or mtime changes."""
+        stat = source.stat()
+        memo = self.hashes.get(source.name)
+        if memo and memo["size"] == stat.st_size and memo["mtime"] == stat.st_mtime:
+            return memo["hash"]
+
+        digest = hash_file(source)
+        self._set("hashes", source.name, {"size": stat.st_size, "mtime": stat.st_mtime, "hash": digest})
+        return digest
+
+    def is_fresh(self, source: Path, cache_path: Path) -> bool:
+        entry = self.entries.get(source.name)
+        if not entry or entry.get("cache") != cache_path.name or not cache_path.exists():
+            return False
+        try:
+            stat = source.stat()
+        except OSError:
+            return False
+        return entry.get("size") == stat.st_size and entry.get("mtime") == stat.st_mtime
+
+    def update(self, source: Path, cache_path: Path) -> dict | None:
+        """Probe `cache_path` and (re)index it under `source` unless already fresh."""
+        if self.is_fresh(source, cache_path):
+            return self.entries[source.name]
+        try:
+            meta = probe_media(cache_path)
+        except Exception as e:
+            print(f"[FootageIndex] Could not probe {cache_path.name}: {e}")
+            return None
+
+        stat = source.stat()
+        entry = {"cache": cache_path.name, "size": stat.st_size, "mtime": stat.st_mtime, **meta}
+        self._set("entries", source.name, entry)
+        self._delete("evicted", source.name)
+        return entry
+
+    def is_evicted(self, source: Path, cache_path: Path) -> bool:
+        """True if this exact normalized clip was evicted for space (a changed source is not)."""
+        record = self.evicted.get(Path(source).name)
+        return bool(record) and record.get("cache") == Path(cache_path).name
+
+    def prune(self, sources: list[Path]):
+        """Drop entries whose source file no longer exists."""
+        keep = {s.name for s in sources}
+        for table in ("entries", "hashes", "evicted"):
+            for name in list(getattr(self, table)):
+                if name not in keep:
+                    self._delete(table, name)
+
+    def touch(self, cache_paths: list[Path]):
+        """Mark clips as used now (LRU bookkeeping)."""
+        now = time.time()
+        for path in cache_paths:
+            self._set("last_used", Path(path).name, now)
+
+    def evict(self, budget_bytes: int) -> tuple[int, int]:
+        """
+        Delete clips no longer referenced by any entry (replaced sources, old
+        filter/profile versions), then least-recently-used normalized clips
+        until `.cached` fits in `budget_bytes`. Recently used or written clips
+        are kept. Evicted sources are recorded so they are only normalized
+        again on demand. Returns (files_removed, bytes_freed).
+        """
+        # Entries another process indexed since we loaded count as referenced too
+        referenced = {e["cache"] for e in self.entries.values()}
+        referenced |= {e["cache"] for e in self._read().get("entries", {}).values()}
+        files = []
+        for path in self.cache_dir.glob("*_norm.mp4"):
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            last = self.last_used.get(path.name, stat.st_mtime)
+            files.append((path.name in referenced, last, stat.st_size, path))
+
+        total = sum(size for _, _, size, _ in files)
+        removed, freed = 0, 0
+        now = time.time()
+
+        # Orphans always go, then referenced clips oldest use first while over budget
+        for is_referenced, last, size, path in sorted(files, key=lambda f: (f[0], f[1])):
+            if is_referenced and total <= budget_bytes:
+                break
+            if now - last < MIN_EVICT_AGE:
+                continue
+            try:
+                path.unlink()
+            except OSError:
+                continue
+            total -= size
+            removed += 1
+            freed += size
+            self._delete("last_used", path.name)
+            if is_referenced:
+                for name in [n for n, e in self.entries.items() if e["cache"] == path.name]:
+                    self._delete("entries", name)
+                    self._set("evicted", name, {"cache": path.name, "at": now})
+
+        return removed, freed
+
+    def cache_size(self) -> int:
+        total = 0
+        for path in self.cache_dir.glob("*_norm.mp4"):
+            try:
+                total += path.stat().st_size
+            except OSError:
+                pass
+        return total
+
+    # Queries
+
+    def entry_for(self, cache_path: Path) -> dict | None:
+        name = Path(cache_path).name
+        for entry in self.entries.values():
+            if entry.get("cache") == name:
+                return entry
+        return None
+
+    def durations(self) -> dict[str, float]:
+        """Map of cached file name -> duration for every indexed clip."""
+        return {e["cache"]: e["duration"] for e in self.entries.values()}
+
+    def select_segments(
+        self,
+        clips: list[Path],
+        target_length: float,
+        start_from: float | None = None,
+        min_segment: float = MIN_SEGMENT,
+        max_segment: float = MAX_SEGMENT,
+        rng: random.Random | None = None
+    ) -> list[tuple[Path, float, float]]:
+        """
+        Fill `target_length` exactly with (clip, start, duration) segments.
+
+        Segments start on keyframes and, except for the last one, also end on
+        keyframes, so they can be stream-copied with the concat demuxer's
+        inpoint/outpoint directives. Clips are visited in a shuffled round-robin
+        so the whole library is used rather than the first seconds of each file.
+        If `start_from` is given, the first segment plays the first clip from
+        that offset (snapped back to a keyframe).
+        """
+        rng = rng or random
+        pool = [(Path(c), self.entry_for(c)) for c in clips]
+        pool = [(c, e) for c, e in pool if e and e["duration"] > 0]
+        if not pool:
+            return []
+
+        segments = []
+        remaining = target_length
+        order = []
+
+        while remaining > 0.001:
+            if not order:
+                order = pool[:]
+                rng.shuffle(order)
+            path, entry = order.pop()
+            duration = entry["duration"]
+            keyframes = entry.get("keyframes") or [0.0]
+
+            if start_from is not None and not segments:
+                start = max((k for k in keyframes if k <= start_from), default=0.0)
+                length = duration - start
+            else:
+                want = rng.uniform(min_segment, max_segment)
+                starts = [k for k in keyframes if k <= duration - want] or [0.0]
+                start = rng.choice(starts)
+                length = min(want, duration - start)
+
+            if length >= remaining:
+                length = remaining
+            else:
+                # Snap the end back onto the keyframe grid so the cut is copy-safe
+                end = max((k for k in keyframes if start < k <= start + length), default=None)
+                if end is not None:
+                    length = end - start
+
+            if length <= 0.001:
+                continue
+            segments.append((path, round(start, 3), round(length, 3)))
+            remaining = round(remaining - length, 3)
+
+        return segments
@@ -6,23 +6,64 @@ Auto-detects the best available hardware encoder:
   - NVENC    (NVIDIA on Linux)
   - VideoToolbox (Apple on macOS)
   - libx264  (CPU fallback, always works)
+
+Every ffmpeg call in the engines builds its encoder arguments through
+`encoder_profile()` / `audio_encoder_args()` so hardware encoding reaches
+all video paths and quality settings live in one place.
 """
 
+import os
+import json
+import glob
+import time
 import subprocess
 import shutil
 import platform
+from pathlib import Path
+from datetime import datetime, timezone
+from concurrent.futures import ThreadPoolExecutor
+from core.engine.ffmpeg_runner import run_probe, encode_in_progress
+from core.utils.common import file_lock, atomic_write
 
 _detected_backend = None  # cached after first probe
 _working_vaapi_device = None
+_capabilities = None
+
+# Probe results are shared across processes (supervisor children, module runs)
+CAPABILITIES_FILE = Path("data/gpu_capabilities.json")
+CAPABILITIES_LOCK = Path("data/.locks/gpu_capabilities.lock")
+CAPABILITIES_REFRESH_AFTER = 24 * 3600  # re-probed once a day by the ingest daemon
+MAX_SESSION_PROBE = 8
+
+
+# Encoders checked for each backend when building the capability matrix
+_CODEC_ENCODERS = {
+    "vaapi": {"h264": "h264_vaapi", "hevc": "hevc_vaapi", "av1": "av1_vaapi"},
+    "nvenc": {"h264": "h264_nvenc", "hevc": "hevc_nvenc", "av1": "av1_nvenc"},
+    "videotoolbox": {"h264": "h264_videotoolbox", "hevc": "hevc_videotoolbox"},
+    "cpu": {"h264": "libx264", "hevc": "libx265", "av1": "libsvtav1"},
+}
+
+_SCALE_FILTERS = {
+    "vaapi": ["scale_vaapi"],
+    "nvenc": ["scale_cuda", "scale_npp"],
+    "videotoolbox": ["scale_vt"],
+    "cpu": [],
+}
+
+# Fallback concurrent encode sessions when the matrix has no measurement.
+# Consumer NVENC/VAAPI hardware throttles or refuses beyond a handful.
+_MAX_HW_SESSIONS = {
+    "vaapi": 3,
+    "nvenc": 3,
+    "videotoolbox": 2,
+}
 
 
 def _probe_encoder(test_args: list[str]) -> bool:
     """Run a tiny FFmpeg encode to check if a hardware encoder works."""
     try:
-        result = subprocess.run(
-            test_args,
-            capture_output=True, text=True, timeout=15
-        )
+        result = run_probe(test_args, label="gpu probe", timeout=15)
         if result.returncode != 0:
             print(f"[GPU Probe Failed] {' '.join(test_args)}\nStderr: {result.stderr.strip()}")
         return result.returncode == 0
@@ -31,68 +72,331 @@ def _probe_encoder(test_args: list[str]) -> bool:
         return False
 
 
-def detect_gpu_backend() -> str:
+def _render_nodes() -> list[str]:
+    render_nodes = sorted(glob.glob("/dev/dri/renderD*"))
+    if not render_nodes:
+        # Fallback if glob fails but device might be mapped directly
+        render_nodes = ["/dev/dri/renderD128"]
+    return render_nodes
+
+
+def _encode_args(backend: str, encoder: str, device: str | None, seconds: float | None = None) -> list[str]:
     """
-    Probe FFmpeg once and return the best available backend name:
-    'vaapi', 'nvenc', 'videotoolbox', or 'cpu'.
+    Dummy encode command for `encoder` on `backend`: a single frame by default,
+    or `seconds` of footage when sessions need to overlap.
     """
-    global _detected_backend, _working_vaapi_device
-    if _detected_backend is not None:
-        return _detected_backend
+    # Use a 1080x1920 dummy to ensure the GPU can actually allocate enough memory!
+    dummy_input = ["-f", "lavfi", "-i", f"color=black:s=1080x1920:d={seconds or 0.1}"]
+    tail = ["-f", "null", "-"] if seconds else ["-frames:v", "1", "-f", "null", "-"]
 
-    if not shutil.which("ffmpeg"):
-        _detected_backend = "cpu"
-        print("[GPU] FFmpeg not found — using CPU encoding.")
-        return _detected_backend
+    command = ["ffmpeg", "-hide_banner", "-loglevel", "error"]
+    if backend == "vaapi":
+        command.extend(["-init_hw_device", f"vaapi=va:{device}", "-filter_hw_device", "va",
+                        *dummy_input, "-vf", "format=nv12,hwupload"])
+    else:
+        command.extend(dummy_input)
+    return [*command, "-c:v", encoder, *tail]
 
-    # Use a 1080x1920 dummy to ensure the GPU can actually allocate enough memory!
-    dummy_input = ["-f", "lavfi", "-i", "color=black:s=1080x1920:d=0.1"]
-    tail = ["-frames:v", "1", "-f", "null", "-"]
 
-    import glob
-    render_nodes = sorted(glob.glob("/dev/dri/renderD*"))
-    if not render_nodes:
-        # Fallback if glob fails but device might be mapped directly
-        render_nodes = ["/dev/dri/renderD128"]
+def _fingerprint() -> dict:
+    """Identifies the ffmpeg build, device nodes and driver the cached probe was made on."""
+    ffmpeg_version = ""
+    if shutil.which("ffmpeg"):
+        try:
+            res = run_probe(["ffmpeg", "-version"], record=False, timeout=10)
+            ffmpeg_version = res.stdout.splitlines()[0] if res.stdout else ""
+        except Exception:
+            pass
+
+    nodes = sorted(glob.glob("/dev/dri/renderD*"))
+    drivers = []
+    for node in nodes:
+        try:
+            drivers.append(os.path.basename(os.readlink(f"/sys/class/drm/{os.path.basename(node)}/device/driver")))
+        except OSError:
+            pass
+    try:
+        with open("/proc/driver/nvidia/version") as f:
+            drivers.append(f.readline().strip())
+    except OSError:
+        pass
+
+    return {
+        "ffmpeg": ffmpeg_version,
+        "nodes": nodes,
+        "driver": drivers,
+        "libva_driver": os.environ.get("LIBVA_DRIVER_NAME", ""),
+        "platform": platform.system(),
+    }
+
+
+def _probe_backend() -> tuple[str, str | None]:
+    """Probe FFmpeg and return the best working (backend, vaapi_device)."""
+    if not shutil.which("ffmpeg"):
+        print("[GPU] FFmpeg not found — using CPU encoding.")
+        return "cpu", None
 
     # 1. VAAPI  (AMD / Intel — Linux)
-    for node in render_nodes:
+    for node in _render_nodes():
         print(f"[GPU] Probing VAAPI node: {node}")
-        if _probe_encoder([
-            "ffmpeg", "-hide_banner", "-loglevel", "error",
-            "-init_hw_device", f"vaapi=va:{node}",
-            "-filter_hw_device", "va",
-            *dummy_input,
-            "-vf", "format=nv12,hwupload",
-            "-c:v", "h264_vaapi", *tail
-        ]):
-            _detected_backend = "vaapi"
-            _working_vaapi_device = node
+        if _probe_encoder(_encode_args("vaapi", "h264_vaapi", node)):
             print(f"[GPU] ✅ VAAPI (AMD/Intel) hardware encoding detected on {node}.")
-            return _detected_backend
+            return "vaapi", node
 
     # 2. NVENC  (NVIDIA — Linux / Windows)
-    if _probe_encoder([
-        "ffmpeg", "-hide_banner", "-loglevel", "error",
-        *dummy_input,
-        "-c:v", "h264_nvenc", *tail
-    ]):
-        _detected_backend = "nvenc"
+    if _probe_encoder(_encode_args("nvenc", "h264_nvenc", None)):
         print("[GPU] ✅ NVENC (NVIDIA) hardware encoding detected.")
-        return _detected_backend
+        return "nvenc", None
 
     # 3. VideoToolbox  (Apple — macOS)
-    if platform.system() == "Darwin" and _probe_encoder([
-        "ffmpeg", "-hide_banner", "-loglevel", "error",
-        *dummy_input,
-        "-c:v", "h264_videotoolbox", *tail
-    ]):
-        _detected_backend = "videotoolbox"
+    if platform.system() == "Darwin" and _probe_encoder(_encode_args("videotoolbox", "h264_videotoolbox", None)):
         print("[GPU] ✅ VideoToolbox (macOS) hardware encoding detected.")
-        return _detected_backend
+        return "videotoolbox", None
 
-    _detected_backend = "cpu"
     print("[GPU] No hardware encoder found — using CPU (libx264).")
+    return "cpu", None
+
+
+def _ffmpeg_listing(flag: str) -> str:
+    try:
+        return run_probe(["ffmpeg", "-hide_banner", flag], record=False, timeout=10).stdout
+    except Exception:
+        return ""
+
+
+def _probe_max_sessions(backend: str, device: str | None) -> int:
+    """Largest number of simultaneous encodes (1, 2, 4, 8...) the hardware accepts."""
+    if backend == "cpu":
+        return max(1, os.cpu_count() or 1)
+
+    # Longer dummy clip so the sessions actually overlap
+    command = _encode_args(backend, _CODEC_ENCODERS[backend]["h264"], device, seconds=2)
+
+    def run_session(sessions: int) -> bool:
+        try:
+            return run_probe(command, label=f"gpu session probe x{sessions}", timeout=30).returncode == 0
+        except subprocess.TimeoutExpired:
+            return False
+
+    best, n = 1, 2
+    while n <= MAX_SESSION_PROBE:
+        with ThreadPoolExecutor(max_workers=n) as pool:
+            ok = all(list(pool.map(run_session, [n] * n)))
+        if not ok:
+            break
+        best, n = n, n * 2
+    return best
+
+
+def _probe_capabilities(previous: dict | None = None) -> dict:
+    """
+    Full probe: best backend plus codec, scaling filter and session matrix.
+    While other encodes are running the session count is taken from
+    `previous` instead: probing would compete with them and under-measure.
+    """
+    backend, device = _probe_backend()
+    caps = {"backend": backend, "vaapi_device": device, "codecs": {}, "scale_filters": [], "max_sessions": 1}
+    if not shutil.which("ffmpeg"):
+        return caps
+
+    encoders = _ffmpeg_listing("-encoders")
+    for codec, encoder in _CODEC_ENCODERS[backend].items():
+        if encoder not in encoders:
+            caps["codecs"][codec] = False
+        elif backend == "cpu":
+            caps["codecs"][codec] = True
+        else:
+            caps["codecs"][codec] = _probe_encoder(_encode_args(backend, encoder, device))
+
+    filters = _ffmpeg_listing("-filters")
+    caps["scale_filters"] = [f for f in _SCALE_FILTERS[backend] if f" {f} " in filters]
+    if previous and previous.get("backend") == backend and encode_in_progress():
+        print("[GPU] Encodes are running, keeping the previous session count.")
+        caps["max_sessions"] = previous.get("max_sessions") or 1
+    else:
+        caps["max_sessions"] = _probe_max_sessions(backend, device)
+    print(f"[GPU] Capabilities: {caps['codecs']}, scale filters {caps['scale_filters']}, "
+          f"{caps['max_sessions']} concurrent session(s).")
+    return caps
+
+
+def _load_cached_capabilities(fingerprint: dict) -> dict | None:
+    try:
+        data = json.loads(CAPABILITIES_FILE.read_text())
+    except Exception:
+        return None
+    if data.get("fingerprint") != fingerprint:
+        return None
+    return data
+
+
+def _save_capabilities(fingerprint: dict, caps: dict):
+    data = dict(caps, fingerprint=fingerprint, probed_at=datetime.now(timezone.utc).isoformat(), probed_ts=time.time())
+    try:
+        atomic_write(CAPABILITIES_FILE, json.dumps(data, indent=2))
+    except OSError as e:
+        print(f"[GPU] Could not save capability cache: {e}")
+    return data
+
+
+def _cache_age() -> float:
+    """Seconds since the capability cache on disk was probed (inf if there is none)."""
+    try:
+        return time.time() - json.loads(CAPABILITIES_FILE.read_text())["probed_ts"]
+    except Exception:
+        return float("inf")
+
+
+def refresh_capabilities_if_due() -> bool:
+    """
+    Re-probe once the cached matrix is older than CAPABILITIES_REFRESH_AFTER,
+    so a driver/firmware change is picked up without blocking a run. Called
+    by the long-lived ingest daemon between its own encodes; only one process
+    probes at a time. Returns True if a probe ran.
+    """
+    global _capabilities
+    # Cheap check first: the daemon calls this every few seconds
+    if _cache_age() <= CAPABILITIES_REFRESH_AFTER:
+        return False
+
+    fingerprint = _fingerprint()
+    with file_lock(CAPABILITIES_LOCK, blocking=False) as acquired:
+        if not acquired:
+            return False
+        # Another process may have refreshed while we were checking
+        cached = _load_cached_capabilities(fingerprint)
+        if cached and time.time() - cached.get("probed_ts", 0) <= CAPABILITIES_REFRESH_AFTER:
+            return False
+        print("[GPU] Capability cache is due, re-probing...")
+        try:
+            _capabilities = _save_capabilities(fingerprint, _probe_capabilities(cached))
+        except Exception as e:
+            print(f"[GPU] Capability refresh failed: {e}")
+            return False
+    return True
+
+
+def get_gpu_capabilities() -> dict:
+    """
+    Capability matrix for this machine: backend, VAAPI device, codec support
+    (h264/hevc/av1), hardware scaling filters and max concurrent sessions.
+
+    Cached in memory, then on disk keyed by ffmpeg version, render nodes and
+    driver, so only the first process after a change pays for the probe.
+    A stale cache is still used; `refresh_capabilities_if_due` renews it.
+    """
+    global _capabilities
+    if _capabilities is not None:
+        return _capabilities
+
+    fingerprint = _fingerprint()
+    cached = _load_cached_capabilities(fingerprint)
+    if cached:
+        print(f"[GPU] Using cached capabilities ({cached['backend']}) from {cached.get('probed_at', 'unknown')}.")
+        _capabilities = cached
+        return _capabilities
+
+    with file_lock(CAPABILITIES_LOCK):
+        # Several processes may start on a fresh machine: probe once, the rest read the result
+        cached = _load_cached_capabilities(fingerprint)
+        _capabilities = cached or _save_capabilities(fingerprint, _probe_capabilities())
+    return _capabilities
+
+
+def detect_gpu_backend() -> str:
+    """
+    Return the best available backend name:
+    'vaapi', 'nvenc', 'videotoolbox', or 'cpu'.
+    """
+    global _detected_backend, _working_vaapi_device
+    if _detected_backend is not None:
+        return _detected_backend
+
+    caps = get_gpu_capabilities()
+    _detected_backend = caps["backend"]
+    _working_vaapi_device = caps.get("vaapi_device")
     return _detected_backend
 
 
+def max_parallel_encodes(backend: str | None = None) -> int:
+    """How many ffmpeg encodes to run side by side on the given (or detected) backend."""
+    backend = backend or detect_gpu_backend()
+    if backend == "cpu":
+        return max(1, os.cpu_count() or 1)
+    caps = get_gpu_capabilities()
+    if caps.get("backend") == backend and caps.get("max_sessions"):
+        return caps["max_sessions"]
+    return _MAX_HW_SESSIONS.get(backend, 1)
+
+
+# Encoder arguments per purpose and backend.
+#   intermediate: cached/normalized clips that get cut and stitched again
+#   final:        footage handed to Remotion or uploaded directly
+#   archive:      long-term copies where size matters more than encode time
+_VIDEO_PROFILES = {
+    "intermediate": {
+        "vaapi": ["-c:v", "h264_vaapi", "-qp", "16"],
+        "nvenc": ["-c:v", "h264_nvenc", "-preset", "p4"],
+        "videotoolbox": ["-c:v", "h264_videotoolbox", "-q:v", "50"],
+        "cpu": ["-c:v", "libx264", "-preset", "fast"],
+    },
+    "final": {
+        "vaapi": ["-c:v", "h264_vaapi", "-qp", "14"],
+        "nvenc": ["-c:v", "h264_nvenc", "-preset", "p5", "-rc", "vbr", "-cq", "14", "-b:v", "0"],
+        "videotoolbox": ["-c:v", "h264_videotoolbox", "-q:v", "65"],
+        "cpu": ["-c:v", "libx264", "-preset", "fast", "-crf", "14"],
+    },
+    "archive": {
+        "vaapi": ["-c:v", "h264_vaapi", "-qp", "20"],
+        "nvenc": ["-c:v", "h264_nvenc", "-preset", "p7", "-rc", "vbr", "-cq", "20", "-b:v", "0"],
+        "videotoolbox": ["-c:v", "h264_videotoolbox", "-q:v", "55"],
+        "cpu": ["-c:v", "libx264", "-preset", "slow", "-crf", "20"],
+    },
+}
+
+_AUDIO_CODECS = {
+    ".mp3": ["-c:a", "libmp3lame", "-q:a", "2"],
+    ".wav": ["-c:a", "pcm_s16le"],
+    ".m4a": ["-c:a", "aac", "-b:a", "192k"],
+    ".aac": ["-c:a", "aac", "-b:a", "192k"],
+    ".mp4": ["-c:a", "aac", "-b:a", "192k"],
+}
+
+
+def encoder_profile(purpose: str = "intermediate", backend: str | None = None) -> dict:
+    """
+    Complete ffmpeg video encoder settings for a purpose on the given (or detected) backend.
+
+    Returns a dict with:
+      - "backend": backend name the profile targets
+      - "input":   args that must come before `-i` (hardware device setup)
+      - "filter":  filter to append to the end of the `-vf` chain ("" if none)
+      - "video":   codec and quality args
+    """
+    if purpose not in _VIDEO_PROFILES:
+        raise ValueError(f"Unknown encoder purpose: {purpose}")
+    backend = backend or detect_gpu_backend()
+
+    codecs = _VIDEO_PROFILES[purpose]
+    profile = {
+        "backend": backend,
+        "input": [],
+        "filter": "",
+        "video": list(codecs.get(backend, codecs["cpu"])),
+    }
+    if backend == "vaapi":
+        device = _working_vaapi_device or "/dev/dri/renderD128"
+        profile["input"] = ["-init_hw_device", f"vaapi=va:{device}", "-filter_hw_device", "va"]
+        profile["filter"] = "format=nv12,hwupload"
+    return profile
+
+
+def video_filter_args(profile: dict, vf: str | None = None) -> list[str]:
+    """`-vf` args combining a caller's filter chain with the profile's upload filter."""
+    chain = ",".join(f for f in (vf, profile["filter"]) if f)
+    return ["-vf", chain] if chain else []
+
+
+def audio_encoder_args(output_path: str | Path) -> list[str]:
+    """Audio codec args matching the container of `output_path` (MP3 by default)."""
+    return list(_AUDIO_CODECS.get(Path(output_path).suffix.lower(), _AUDIO_CODECS[".mp3"]))
@@ -0,0 +1,58 @@
+"""
+Audio bed pre-mixing for Remotion renders.
+
+Loudness-normalizes the voiceover, lays the (looped) music under it with
+sidechain ducking and trims the result to the exact video length, so the
+renderer only has to play back a single finished track.
+"""
+
+from pathlib import Path
+from core.engine.gpu import audio_encoder_args
+from core.engine.ffmpeg_runner import run_ffmpeg
+
+VOICE_LUFS = -16         # YouTube-ish integrated loudness target for the narration
+MUSIC_BED_DB = -18       # Music level relative to the voice before ducking
+DUCK_THRESHOLD = 0.02    # Sidechain level above which the voice starts ducking the music
+DUCK_RATIO = 6
+SAMPLE_RATE = 48000
+
+
+def mix_audio_bed(
+    voice_path: str | Path,
+    output_path: str | Path,
+    duration: float,
+    music_path: str | Path | None = None
+) -> Path:
+    """
+    Render the final audio track: normalized voice plus ducked music,
+    padded or trimmed to `duration` seconds. The codec follows `output_path`.
+    """
+    output_path = Path(output_path)
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+
+    voice = f"loudnorm=I={VOICE_LUFS}:TP=-1.5:LRA=11,aresample={SAMPLE_RATE}"
+    cmd = ["ffmpeg", "-y", "-hide_banner", "-loglevel", "error", "-i", str(voice_path)]
+
+    if music_path:
+        cmd += ["-stream_loop", "-1", "-i", str(music_path)]
+        filter_complex = (
+            f"[0:a]{voice},asplit=2[voice][key];"
+            f"[1:a]loudnorm=I={VOICE_LUFS}:TP=-1.5:LRA=11,aresample={SAMPLE_RATE},"
+            f"volume={MUSIC_BED_DB}dB[music];"
+            f"[music][key]sidechaincompress=threshold={DUCK_THRESHOLD}:ratio={DUCK_RATIO}"
+            f":attack=20:release=400[ducked];"
+            f"[voice][ducked]amix=inputs=2:duration=longest:normalize=0,apad[bed]"
+        )
+    else:
+        filter_complex = f"[0:a]{voice},apad[bed]"
+
+    cmd += [
+        "-filter_complex", filter_complex,
+        "-map", "[bed]",
+        "-t", f"{duration:.3f}",
+        *audio_encoder_args(output_path),
+        str(output_path)
+    ]
+
+    run_ffmpeg(cmd, label=f"audio bed {output_path.name}", duration=duration)
+    return output_path
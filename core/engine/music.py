@@ -2,18 +2,14 @@ import os
 import requests
 import base64
 from pathlib import Path
-from core.api.llm import gpt_request
+from core.api.llm import gpt_request, gpt_request_async, STORY_CACHE_TTL
 
 LYRIA_API_KEY = os.getenv("GEMINI_API_KEY")
 # Generic endpoint for Lyria API - adjust if using a different gateway
 LYRIA_ENDPOINT = os.getenv("LYRIA_ENDPOINT", "https://generativelanguage.googleapis.com/v1beta/models/lyria-3-pro-preview:predict")
 
-def generate_music_prompt(script: str, video_type: str) -> str:
-    """
-    Uses an LLM to generate a highly engaging, retention-optimized 
-    music prompt for Google Lyria 3 Pro based on the script and video type.
-    """
-    prompt = f"""
+def _music_prompt_request(script: str, video_type: str) -> str:
+    return f"""
 You are an expert audio director and psychologist specializing in viewer retention for short-form video content.
 Your task is to write a highly detailed music generation prompt for Google Lyria 3 Pro.
 
@@ -29,18 +25,33 @@ Requirements for the music prompt:
 4. Keep the prompt strictly under 200 words.
 5. Output ONLY the prompt itself, nothing else.
 """
-    
-    response = gpt_request(prompt)
+
+def _music_prompt_result(response: str, video_type: str) -> str:
     if not response:
         # Fallback generic prompt
         return f"Engaging background music for a {video_type} video, starting with a strong hook and building tension."
     
     return response.strip()
 
-def generate_music_lyria(script: str, video_type: str, duration_sec: int, output_path: str | Path) -> str:
+def generate_music_prompt(script: str, video_type: str, cache_ttl: float | None = STORY_CACHE_TTL) -> str:
+    """
+    Uses an LLM to generate a highly engaging, retention-optimized 
+    music prompt for Google Lyria 3 Pro based on the script and video type.
+    """
+    response = gpt_request(_music_prompt_request(script, video_type), cache_ttl=cache_ttl)
+    return _music_prompt_result(response, video_type)
+
+async def generate_music_prompt_async(script: str, video_type: str, cache_ttl: float | None = STORY_CACHE_TTL) -> str:
+    """Async `generate_music_prompt`."""
+    response = await gpt_request_async(_music_prompt_request(script, video_type), cache_ttl=cache_ttl)
+    return _music_prompt_result(response, video_type)
+
+def generate_music_lyria(script: str, video_type: str, duration_sec: int, output_path: str | Path,
+                         music_prompt: str | None = None) -> str:
     """
     Generates music using Google Lyria 3 Pro based on the script and video type,
-    and saves it to the output_path.
+    and saves it to the output_path. A `music_prompt` generated ahead of time
+    (e.g. concurrently with other LLM calls) skips the prompt request.
     
     Returns the path to the generated music file.
     """
@@ -48,8 +59,9 @@ def generate_music_lyria(script: str, video_type: str, duration_sec: int, output
         print("⚠️ LYRIA_API_KEY is missing from environment variables. Skipping music generation.")
         return ""
         
-    print(f"🎵 Generating Lyria music prompt for {video_type} video...")
-    music_prompt = generate_music_prompt(script, video_type)
+    if not music_prompt:
+        print(f"🎵 Generating Lyria music prompt for {video_type} video...")
+        music_prompt = generate_music_prompt(script, video_type)
     print(f"🎵 Music Prompt: {music_prompt}")
     
     headers = {
@@ -0,0 +1,222 @@
+"""
+Indexed catalog of the local background music library.
+
+Lives in the music folder as `.catalog.json` and stores, per track, its
+duration, integrated loudness (LUFS), estimated tempo (BPM) and tags (from
+the file's genre/mood/comment metadata plus derived tempo and energy tags).
+Each track is analyzed once with a single ffmpeg pass and re-analyzed only
+when its size or mtime changes, so choosing music never probes files.
+
+Tracks are bucketed by tag and sorted by duration in memory, so "a calm
+track at least 75s long" is a dict lookup plus a bisect.
+"""
+
+import re
+import sys
+import json
+import math
+import random
+import bisect
+from array import array
+from pathlib import Path
+from core.engine.ffmpeg_runner import run_probe
+from core.utils.common import atomic_write
+
+CATALOG_NAME = ".catalog.json"
+CATALOG_VERSION = 1
+MUSIC_EXTENSIONS = {".mp3", ".wav", ".m4a"}
+
+ANALYSIS_RATE = 11025
+ANALYSIS_HOP = 256           # ~43 onset frames per second
+BPM_RANGE = (60, 180)
+BPM_WINDOW = 120             # seconds of audio used for tempo estimation
+
+_LOUDNESS = re.compile(r"^\s*I:\s*(-?[\d.]+) LUFS", re.MULTILINE)
+_METADATA = re.compile(r"^\s+(genre|mood|comment)\s*:\s*(.+)$", re.MULTILINE | re.IGNORECASE)
+
+
+def _estimate_bpm(pcm: bytes) -> float | None:
+    """Tempo from the autocorrelation of the onset (energy flux) envelope."""
+    samples = array("h")
+    samples.frombytes(pcm[:min(len(pcm), BPM_WINDOW * ANALYSIS_RATE * 2) // 2 * 2])
+    if sys.byteorder == "big":
+        samples.byteswap()
+
+    energies = []
+    for i in range(0, len(samples) - ANALYSIS_HOP, ANALYSIS_HOP):
+        frame = samples[i:i + ANALYSIS_HOP]
+        energies.append(math.log10(sum(x * x for x in frame) / ANALYSIS_HOP + 1.0))
+    onsets = [max(0.0, b - a) for a, b in zip(energies, energies[1:])]
+    if len(onsets) < 100:
+        return None
+
+    mean = sum(onsets) / len(onsets)
+    onsets = [o - mean for o in onsets]
+    fps = ANALYSIS_RATE / ANALYSIS_HOP
+
+    best_bpm, best_score = None, 0.0
+    for lag in range(int(60 * fps / BPM_RANGE[1]), int(60 * fps / BPM_RANGE[0]) + 1):
+        score = sum(a * b for a, b in zip(onsets, onsets[lag:])) / (len(onsets) - lag)
+        bpm = 60 * fps / lag
+        # Mild preference for common tempos to avoid half/double-time picks
+        score *= math.exp(-0.5 * math.log2(bpm / 120) ** 2)
+        if score > best_score:
+            best_bpm, best_score = bpm, score
+    return round(best_bpm, 1) if best_bpm else None
+
+
+def _derived_tags(bpm: float | None, loudness: float | None) -> list[str]:
+    tags = []
+    if bpm:
+        tags.append("slow" if bpm < 90 else "fast" if bpm > 125 else "medium")
+    if loudness is not None:
+        tags.append("calm" if loudness < -18 else "energetic" if loudness > -12 else "balanced")
+    return tags
+
+
+def analyze_track(track: Path) -> dict:
+    """One ffmpeg pass: loudness summary and metadata on stderr, mono PCM on stdout."""
+    res = run_probe(
+        ["ffmpeg", "-hide_banner", "-nostats", "-v", "info", "-i", str(track),
+         "-af", f"ebur128=framelog=quiet,aresample={ANALYSIS_RATE}",
+         "-ac", "1", "-f", "s16le", "pipe:1"],
+        label=f"analyze {track.name}", text=False, check=True
+    )
+    log = res.stderr.decode("utf-8", errors="replace")
+    pcm = res.stdout
+
+    loudness = None
+    found = _LOUDNESS.findall(log)
+    if found:
+        loudness = float(found[-1])
+
+    tags = set()
+    for _, value in _METADATA.findall(log):
+        tags.update(t.strip().lower() for t in re.split(r"[,;/]", value) if t.strip())
+
+    bpm = _estimate_bpm(pcm)
+    tags.update(_derived_tags(bpm, loudness))
+
+    return {
+        "duration": round(len(pcm) / 2 / ANALYSIS_RATE, 2),
+        "loudness": loudness,
+        "bpm": bpm,
+        "tags": sorted(tags),
+    }
+
+
+class MusicCatalog:
+    """JSON-backed analysis index for a music folder."""
+
+    def __init__(self, music_dir: Path, exclude: tuple[str, ...] = ("lyria_custom",)):
+        self.music_dir = Path(music_dir)
+        self.path = self.music_dir / CATALOG_NAME
+        self.exclude = exclude
+        self.entries: dict[str, dict] = {}
+        self._by_tag: dict[str, tuple[list[float], list[str]]] = {}
+        self._dirty = False
+        self.load()
+
+    # Persistence
+
+    def load(self):
+        try:
+            data = json.loads(self.path.read_text())
+        except (OSError, ValueError):
+            data = {}
+        if data.get("version") != CATALOG_VERSION:
+            data = {}
+        self.entries = data.get("entries", {})
+        self._build_buckets()
+
+    def save(self):
+        """Atomically write the catalog if anything changed."""
+        if not self._dirty:
+            return
+        atomic_write(self.path, json.dumps({"version": CATALOG_VERSION, "entries": self.entries}, indent=2))
+        self._dirty = False
+
+    # Maintenance
+
+    def tracks(self) -> list[Path]:
+        if not self.music_dir.exists():
+            return []
+        return sorted(
+            f for f in self.music_dir.iterdir()
+            if f.is_file() and f.suffix.lower() in MUSIC_EXTENSIONS
+            and not any(x in f.name for x in self.exclude)
+        )
+
+    def sync(self) -> "MusicCatalog":
+        """Analyze new or changed tracks, drop deleted ones and save."""
+        present = {}
+        for track in self.tracks():
+            stat = track.stat()
+            present[track.name] = track
+            entry = self.entries.get(track.name)
+            if entry and entry["size"] == stat.st_size and entry["mtime"] == stat.st_mtime:
+                continue
+            try:
+                print(f"[MusicCatalog] Analyzing {track.name}...")
+                meta = analyze_track(track)
+            except Exception as e:
+                print(f"[MusicCatalog] Could not analyze {track.name}: {e}")
+                continue
+            self.entries[track.name] = {"size": stat.st_size, "mtime": stat.st_mtime, **meta}
+            self._dirty = True
+
+        for name in list(self.entries):
+            if name not in present:
+                del self.entries[name]
+                self._dirty = True
+
+        if self._dirty:
+            self._build_buckets()
+            self.save()
+        return self
+
+    def _build_buckets(self):
+        buckets: dict[str, list[tuple[float, str]]] = {"": []}
+        for name, entry in self.entries.items():
+            for tag in ["", *entry.get("tags", [])]:
+                buckets.setdefault(tag, []).append((entry["duration"], name))
+        self._by_tag = {}
+        for tag, items in buckets.items():
+            items.sort()
+            self._by_tag[tag] = ([d for d, _ in items], [n for _, n in items])
+
+    # Queries
+
+    def find(self, min_duration: float = 0.0, mood: str | None = None) -> list[Path]:
+        """Tracks tagged `mood` (any, if unknown) lasting at least `min_duration`, shortest first."""
+        durations, names = self._by_tag.get((mood or "").lower()) or self._by_tag.get("", ([], []))
+        start = bisect.bisect_left(durations, min_duration)
+        return [self.music_dir / n for n in names[start:]]
+
+    def choose(self, min_duration: float = 0.0, mood: str | None = None,
+               rng: random.Random | None = None) -> Path | None:
+        """
+        Random track matching `find`; if none is long enough, the longest one
+        with that mood (it will be looped).
+        """
+        rng = rng or random
+        matches = self.find(min_duration, mood)
+        if matches:
+            return rng.choice(matches)
+        _, names = self._by_tag.get((mood or "").lower()) or self._by_tag.get("", ([], []))
+        return self.music_dir / names[-1] if names else None
+
+    def match_mood(self, text: str) -> str | None:
+        """
+        The catalog tag mentioned most often in `text` (e.g. a music prompt's
+        "calm, slow piano"), or None if it names none of them.
+        """
+        counts = {}
+        for word in re.findall(r"[a-z][a-z-]*", (text or "").lower()):
+            if word in self._by_tag:
+                counts[word] = counts.get(word, 0) + 1
+        # Ties go to the tag with more tracks, so the choice stays varied
+        return max(counts, key=lambda t: (counts[t], len(self._by_tag[t][1])), default=None)
+
+    def entry_for(self, track: Path) -> dict | None:
+        return self.entries.get(Path(track).name)
@@ -0,0 +1,348 @@
+"""
+Word-level subtitle timing for narrated videos.
+
+The narration text is known up front (it is what we sent to TTS), so instead
+of recognizing the audio we align the script to it: TTS pauses at
+punctuation, so the silences detected in the audio are matched to the
+script's punctuation with a small dynamic-programming (DTW-style) search,
+and words are spread over the speech between those anchors by their
+expected spoken length. When the alignment is not confident enough, Whisper
+transcription is used instead.
+
+Both paths return the same 3-word chunks Remotion expects:
+    [{"word": "three word chunk", "start": 0.0, "end": 0.9}, ...]
+"""
+
+import re
+import sys
+import json
+import math
+from array import array
+from pathlib import Path
+from core.engine.ffmpeg_runner import run_probe
+from core.engine.video import clean_subtitle_text
+from core.utils.common import atomic_write
+
+ALIGN_SAMPLE_RATE = 16000
+FRAME_SECONDS = 0.01
+MIN_PAUSE = 0.12            # silence shorter than this is part of a word (stops, breaths)
+MIN_ALIGN_CONFIDENCE = 0.75  # below this, fall back to Whisper
+WORDS_SUFFIX = ".words.json"  # word timings written next to the narration by generate_tts
+
+# Relative cost weights of the anchor search
+RATE_WEIGHT = 4.0           # per unit of |log(actual / expected speech rate)|
+SKIP_PAUSE_COST = 1.5       # a silence that matches no punctuation
+SKIP_PUNCT_COST = {2: 1.0, 1: 0.3}  # punctuation that got no audible pause
+MAX_SKIP_PAUSES = 4
+MAX_SKIP_PUNCT = 8
+
+_SENTENCE_END = re.compile(r"[.?!…]+[\"')\]]*$")
+_CLAUSE_END = re.compile(r"[,;:—–-]+[\"')\]]*$")
+
+
+def group_words(words: list[dict], max_words: int = 3) -> list[dict]:
+    """Group word timings into `max_words` chunks, breaking early at punctuation."""
+    chunks = []
+    current_chunk = []
+    current_start = None
+
+    for w in words:
+        if current_start is None:
+            current_start = w["start"]
+
+        current_chunk.append(w["word"])
+
+        # Break chunk at 3 words OR if there's heavy punctuation
+        if len(current_chunk) >= max_words or w["word"].endswith((".", "?", "!", ",")):
+            chunks.append({
+                "word": " ".join(current_chunk),
+                "start": current_start,
+                "end": w["end"]
+            })
+            current_chunk = []
+            current_start = None
+
+    # Append any remaining words
+    if current_chunk:
+        chunks.append({
+            "word": " ".join(current_chunk),
+            "start": current_start,
+            "end": words[-1]["end"]
+        })
+
+    return chunks
+
+
+def decode_pcm(audio_path: str | Path, sample_rate: int = ALIGN_SAMPLE_RATE) -> bytes:
+    """Decode any audio file to mono 16-bit PCM."""
+    res = run_probe(
+        ["ffmpeg", "-v", "error", "-i", str(audio_path),
+         "-f", "s16le", "-ac", "1", "-ar", str(sample_rate), "pipe:1"],
+        label=f"decode {Path(audio_path).name}", text=False, check=True
+    )
+    return res.stdout
+
+
+def _frame_energies(pcm: bytes, sample_rate: int) -> list[float]:
+    samples = array("h")
+    samples.frombytes(pcm[:len(pcm) // 2 * 2])
+    if sys.byteorder == "big":
+        samples.byteswap()
+
+    hop = max(1, int(sample_rate * FRAME_SECONDS))
+    energies = []
+    for i in range(0, len(samples), hop):
+        frame = samples[i:i + hop]
+        energies.append(10 * math.log10(sum(x * x for x in frame) / len(frame) + 1.0))
+    return energies
+
+
+def _find_pauses(energies: list[float]) -> tuple[int, int, list[tuple[int, int]]]:
+    """Return (first_voiced, last_voiced, interior pauses as (start, end) frame ranges)."""
+    ordered = sorted(energies)
+    floor = ordered[int(len(ordered) * 0.05)]
+    peak = ordered[int(len(ordered) * 0.95)]
+    threshold = floor + 0.25 * (peak - floor)
+    voiced = [e > threshold for e in energies]
+
+    if not any(voiced):
+        return 0, 0, []
+    first = voiced.index(True)
+    last = len(voiced) - 1 - voiced[::-1].index(True)
+
+    min_frames = int(MIN_PAUSE / FRAME_SECONDS)
+    pauses = []
+    start = None
+    for i in range(first, last + 1):
+        if not voiced[i]:
+            if start is None:
+                start = i
+        elif start is not None:
+            if i - start >= min_frames:
+                pauses.append((start, i))
+            start = None
+    return first, last + 1, pauses
+
+
+def _word_weight(word: str) -> float:
+    """Rough spoken length of a word: letters, with digits read out as longer."""
+    letters = sum(1 for c in word if c.isalpha())
+    digits = sum(1 for c in word if c.isdigit())
+    return letters + 3 * digits + 1.5
+
+
+def _break_strength(word: str, next_sep: str) -> int:
+    # Stand-alone punctuation skipped by the tokenizer (" — ") still marks a break
+    tail = word + next_sep.strip()
+    if "\n" in next_sep or _SENTENCE_END.search(word) or _SENTENCE_END.search(tail):
+        return 2
+    if _CLAUSE_END.search(tail):
+        return 1
+    return 0
+
+
+def _search_anchors(
+    candidates: list[tuple[float, int]],
+    pauses: list[float],
+    total: float
+) -> list[tuple[int, int]]:
+    """
+    Match pause positions to punctuation positions (both in speech seconds)
+    keeping the implied speaking rate between consecutive anchors steady.
+    Returns the matched (candidate index, pause index) pairs in order.
+    """
+    k, m = len(candidates), len(pauses)
+    # Virtual anchors at both ends of the speech
+    cand_pos = [0.0] + [c[0] for c in candidates] + [total]
+    cand_strength = [0] + [c[1] for c in candidates] + [0]
+    pause_pos = [0.0] + pauses + [total]
+
+    skip_cost = [0.0]
+    for strength in cand_strength:
+        skip_cost.append(skip_cost[-1] + SKIP_PUNCT_COST.get(strength, 0.0))
+
+    def skipped_punct(c0: int, c1: int) -> float:
+        return skip_cost[c1] - skip_cost[c0 + 1]
+
+    def rate(c0: int, j0: int, c1: int, j1: int) -> float:
+        expected = cand_pos[c1] - cand_pos[c0]
+        actual = pause_pos[j1] - pause_pos[j0]
+        if expected <= 0 or actual <= 0:
+            return math.inf
+        return RATE_WEIGHT * abs(math.log(actual / expected))
+
+    best = {(0, 0): (0.0, None)}
+    for c in range(1, k + 2):
+        for j in range(1, m + 2):
+            # The end anchors can only match each other
+            if (c == k + 1) != (j == m + 1):
+                continue
+            options = []
+            for c0 in range(max(0, c - MAX_SKIP_PUNCT - 1), c):
+                for j0 in range(max(0, j - MAX_SKIP_PAUSES - 1), j):
+                    prev = best.get((c0, j0))
+                    if prev is None:
+                        continue
+                    cost = (prev[0] + rate(c0, j0, c, j)
+                            + skipped_punct(c0, c) + SKIP_PAUSE_COST * (j - j0 - 1))
+                    options.append((cost, (c0, j0)))
+            if options:
+                best[(c, j)] = min(options)
+
+    if (k + 1, m + 1) not in best:
+        return []
+
+    path = []
+    node = best[(k + 1, m + 1)][1]
+    while node and node != (0, 0):
+        path.append((node[0] - 1, node[1] - 1))
+        node = best[node][1]
+    return path[::-1]
+
+
+def align_script(script: str, audio_path: str | Path | None = None, pcm: bytes | None = None,
+                 sample_rate: int = ALIGN_SAMPLE_RATE) -> tuple[list[dict], float]:
+    """
+    Force-align `script` to its narration.
+
+    Pass either `audio_path` or mono 16-bit `pcm` at `sample_rate`.
+    Returns (word timings, confidence in [0, 1]).
+    """
+    # Markdown and symbols the LLM adds are not spoken and must not reach the screen
+    script = clean_subtitle_text(script)
+    tokens = list(re.finditer(r"\S*\w\S*", script))
+    if not tokens:
+        return [], 0.0
+    if pcm is None:
+        pcm = decode_pcm(audio_path, sample_rate)
+
+    energies = _frame_energies(pcm, sample_rate)
+    if not energies:
+        return [], 0.0
+    first, last, pause_frames = _find_pauses(energies)
+    speech_frames = last - first - sum(e - s for s, e in pause_frames)
+    if speech_frames <= 0:
+        return [], 0.0
+
+    # Speech time (pauses removed) at which each pause occurs
+    pause_pos = []
+    consumed = 0
+    for s, e in pause_frames:
+        pause_pos.append((s - first - consumed) * FRAME_SECONDS)
+        consumed += e - s
+    total = speech_frames * FRAME_SECONDS
+
+    words = [t.group() for t in tokens]
+    weights = [_word_weight(w) for w in words]
+    scale = total / sum(weights)
+    bounds = [0.0]
+    for w in weights:
+        bounds.append(bounds[-1] + w * scale)
+
+    # Punctuated word boundaries are where TTS pauses
+    candidates = []
+    cand_words = []
+    for i, tok in enumerate(tokens[:-1]):
+        strength = _break_strength(tok.group(), script[tok.end():tokens[i + 1].start()])
+        if strength:
+            candidates.append((bounds[i + 1], strength))
+            cand_words.append(i + 1)
+
+    path = _search_anchors(candidates, pause_pos, total)
+    if not path and (candidates or pause_pos):
+        return [], 0.0
+
+    # Piecewise-linear map from expected to measured speech time through the anchors
+    anchors = [(0.0, 0.0)] + [(candidates[c][0], pause_pos[j]) for c, j in path] + [(total, total)]
+
+    def to_speech(pos: float) -> float:
+        for (e0, p0), (e1, p1) in zip(anchors, anchors[1:]):
+            if pos <= e1:
+                return p0 if e1 == e0 else p0 + (pos - e0) * (p1 - p0) / (e1 - e0)
+        return total
+
+    def to_wall(speech: float, after_pause: bool) -> float:
+        frames = speech / FRAME_SECONDS
+        wall = first + frames
+        for (s, e), pos in zip(pause_frames, pause_pos):
+            if pos < speech - 1e-6 or (after_pause and abs(pos - speech) <= 1e-6):
+                wall += e - s
+        return round(wall * FRAME_SECONDS, 3)
+
+    timed = []
+    for i, word in enumerate(words):
+        timed.append({
+            "word": word,
+            "start": to_wall(to_speech(bounds[i]), after_pause=True),
+            "end": to_wall(to_speech(bounds[i + 1]), after_pause=False),
+        })
+
+    # Confidence: how well pauses and sentence ends explain each other
+    matched_cands = {c for c, _ in path}
+    sentence_ends = [c for c, (_, strength) in enumerate(candidates) if strength == 2]
+    pause_cov = len(path) / len(pause_pos) if pause_pos else 1.0
+    sentence_cov = (
+        sum(1 for c in sentence_ends if c in matched_cands) / len(sentence_ends)
+        if sentence_ends else 1.0
+    )
+    # ...and how steady the speaking rate is between anchors
+    drift = [
+        abs(math.log((p1 - p0) / (e1 - e0)))
+        for (e0, p0), (e1, p1) in zip(anchors, anchors[1:])
+        if e1 > e0 and p1 > p0
+    ]
+    rate_fit = math.exp(-sum(drift) / len(drift)) if drift else 0.0
+    confidence = (pause_cov + sentence_cov) / 2 * rate_fit
+
+    # Reject implausible speaking rates (wrong audio / wrong script)
+    chars_per_sec = sum(weights) / total
+    if not 6 <= chars_per_sec <= 35:
+        confidence = 0.0
+
+    return timed, round(confidence, 3)
+
+
+def words_path_for(audio_path: str | Path) -> Path:
+    return Path(audio_path).with_suffix(WORDS_SUFFIX)
+
+
+def save_word_timings(audio_path: str | Path, words: list[dict]):
+    """Store word timings for `audio_path` so `build_subtitles` can skip alignment."""
+    atomic_write(words_path_for(audio_path), json.dumps(words))
+
+
+def load_word_timings(audio_path: str | Path) -> list[dict] | None:
+    """Word timings saved alongside `audio_path`, if they are newer than the audio."""
+    path = words_path_for(audio_path)
+    try:
+        if path.stat().st_mtime < Path(audio_path).stat().st_mtime - 1:
+            return None
+        return json.loads(path.read_text())
+    except (OSError, ValueError):
+        return None
+
+
+def build_subtitles(audio_path: str | Path, script: str | None = None,
+                    min_confidence: float = MIN_ALIGN_CONFIDENCE) -> list[dict]:
+    """
+    Subtitle chunks for `audio_path`: aligned to `script` when it is given and
+    the alignment is confident, otherwise transcribed with Whisper. Timings
+    produced while the narration was synthesized are used as-is.
+    """
+    words = load_word_timings(audio_path)
+    if words:
+        print(f"[Subtitles] Using {len(words)} word timings from TTS synthesis.")
+        return group_words(words)
+
+    if script:
+        try:
+            words, confidence = align_script(script, audio_path)
+            if words and confidence >= min_confidence:
+                print(f"[Subtitles] Aligned {len(words)} words to the script (confidence {confidence:.2f}).")
+                return group_words(words)
+            print(f"[Subtitles] Alignment confidence {confidence:.2f} < {min_confidence}, using Whisper.")
+        except Exception as e:
+            print(f"[Subtitles] Alignment failed ({e}), using Whisper.")
+
+    from core.api.llm import transcribe_audio_with_timestamps
+    return transcribe_audio_with_timestamps(str(audio_path))
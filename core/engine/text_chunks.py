@@ -0,0 +1,80 @@
+"""
+Sentence-bounded text chunking for TTS requests.
+
+`chunk_text` splits a whole script; `stream_chunks` does the same for text
+that arrives in pieces (a streamed LLM response), yielding identical chunks
+so cached TTS audio is shared between the two paths.
+"""
+
+import re
+from typing import Iterable, Iterator
+
+def chunk_text(text: str, max_chars: int = 600) -> list[str]:
+    """
+    Splits text into chunks respecting sentence boundaries to avoid 
+    Google TTS 'Sentence too long' errors.
+    """
+    # Split by sentence endings (. ? ! or newlines)
+    # The regex keeps the punctuation with the sentence
+    sentences = re.split(r'(?<=[.?!])\s+|\n+', text)
+    
+    chunks = []
+    current_chunk = ""
+
+    for sentence in sentences:
+        if not sentence.strip():
+            continue
+            
+        # If adding this sentence exceeds max_chars, push current_chunk and start new
+        if len(current_chunk) + len(sentence) > max_chars:
+            if current_chunk:
+                chunks.append(current_chunk.strip())
+            current_chunk = sentence
+        else:
+            current_chunk += " " + sentence
+
+    if current_chunk:
+        chunks.append(current_chunk.strip())
+        
+    return chunks
+
+_SENTENCE_SPLIT = re.compile(r'(?<=[.?!])\s+|\n+')
+
+def stream_chunks(text_stream: Iterable[str], max_chars: int = 600) -> Iterator[str]:
+    """
+    Incremental `chunk_text`: consumes text as it arrives and yields each chunk
+    as soon as it is final (the next complete sentence no longer fits).
+    Produces exactly the chunks `chunk_text` would for the full text.
+    """
+    buffer = ""
+    current_chunk = ""
+
+    def add(sentence: str):
+        nonlocal current_chunk
+        if not sentence.strip():
+            return None
+        if len(current_chunk) + len(sentence) > max_chars:
+            done = current_chunk.strip() if current_chunk else None
+            current_chunk = sentence
+            return done
+        current_chunk += " " + sentence
+        return None
+
+    for piece in text_stream:
+        buffer += piece
+        # Trailing whitespace may continue in the next piece, and the full-text split
+        # would swallow all of it: only split where a separator is followed by text
+        text = buffer.rstrip()
+        *sentences, rest = _SENTENCE_SPLIT.split(text)
+        buffer = rest + buffer[len(text):]
+        for sentence in sentences:
+            done = add(sentence)
+            if done:
+                yield done
+
+    for sentence in _SENTENCE_SPLIT.split(buffer):
+        done = add(sentence)
+        if done:
+            yield done
+    if current_chunk.strip():
+        yield current_chunk.strip()
@@ -0,0 +1,204 @@
+"""
+Concurrency-safe TTS character ledger.
+
+Every run reserves the characters it is about to send before synthesis and
+then commits (or releases) the reservation, all inside SQLite transactions
+in data/tts_usage.db, so parallel pipelines can never jointly overshoot the
+monthly limit and a crash mid-run cannot lose counts. Reservations left
+behind by a dead process expire after RESERVATION_TTL.
+
+Monthly totals are computed from the ledger and mirrored to
+data/tts_usage.json for the dashboard.
+"""
+
+import json
+import time
+import sqlite3
+from pathlib import Path
+from core.utils.common import get_now, atomic_write
+
+DB_FILE = Path("data/tts_usage.db")
+STATUS_FILE = Path("data/tts_usage.json")
+RESERVATION_TTL = 3600  # seconds before an uncommitted reservation is considered abandoned
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS ledger (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    scope TEXT NOT NULL,
+    month TEXT NOT NULL,
+    chars INTEGER NOT NULL,
+    state TEXT NOT NULL,  -- reserved | committed | released
+    created REAL NOT NULL,
+    updated REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ledger_scope_month ON ledger (scope, month, state);
+CREATE TABLE IF NOT EXISTS limits (
+    scope TEXT PRIMARY KEY,
+    monthly_limit INTEGER NOT NULL
+);
+"""
+
+
+def current_month() -> str:
+    return get_now().strftime("%Y-%m")
+
+
+def _connect() -> sqlite3.Connection:
+    DB_FILE.parent.mkdir(exist_ok=True)
+    # Autocommit mode; transactions are opened explicitly with BEGIN IMMEDIATE
+    conn = sqlite3.connect(DB_FILE, timeout=30, isolation_level=None)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.executescript(_SCHEMA)
+    return conn
+
+
+def _expire_stale(conn: sqlite3.Connection):
+    now = time.time()
+    conn.execute(
+        "UPDATE ledger SET state = 'released', updated = ? WHERE state = 'reserved' AND created < ?",
+        (now, now - RESERVATION_TTL)
+    )
+
+
+def _month_total(conn: sqlite3.Connection, scope: str, month: str, include_reserved: bool = True) -> int:
+    states = ("committed", "reserved") if include_reserved else ("committed", "committed")
+    row = conn.execute(
+        "SELECT COALESCE(SUM(chars), 0) FROM ledger WHERE scope = ? AND month = ? AND state IN (?, ?)",
+        (scope, month, *states)
+    ).fetchone()
+    return row[0]
+
+
+def import_legacy(scope: str, month: str, used: int):
+    """
+    Seed the ledger with usage tracked before it existed (the old
+    module-config counter). Only applies while the scope has no rows at all.
+    """
+    if not used or not month:
+        return
+    conn = _connect()
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        exists = conn.execute("SELECT 1 FROM ledger WHERE scope = ? LIMIT 1", (scope,)).fetchone()
+        if not exists:
+            now = time.time()
+            conn.execute(
+                "INSERT INTO ledger (scope, month, chars, state, created, updated) VALUES (?, ?, ?, 'committed', ?, ?)",
+                (scope, month, int(used), now, now)
+            )
+            print(f"[TTSUsage] Imported {used:,} chars for {scope} ({month}) from module config.")
+        conn.execute("COMMIT")
+    finally:
+        conn.close()
+
+
+def reserve(scope: str, chars: int, monthly_limit: int) -> int:
+    """
+    Atomically reserve `chars` against this month's limit.
+    Returns the reservation id; raises RuntimeError if the limit would be exceeded.
+    """
+    month = current_month()
+    conn = _connect()
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        _expire_stale(conn)
+        conn.execute(
+            "INSERT INTO limits (scope, monthly_limit) VALUES (?, ?) "
+            "ON CONFLICT(scope) DO UPDATE SET monthly_limit = excluded.monthly_limit",
+            (scope, int(monthly_limit))
+        )
+        used = _month_total(conn, scope, month)
+        if used + chars > monthly_limit:
+            conn.execute("COMMIT")
+            raise RuntimeError(
+                f"❌ TTS request blocked.\n"
+                f"Used this month: {used:,} chars (including in-flight runs)\n"
+                f"Request size: {chars:,} chars\n"
+                f"Monthly limit: {monthly_limit:,} chars"
+            )
+        now = time.time()
+        cur = conn.execute(
+            "INSERT INTO ledger (scope, month, chars, state, created, updated) VALUES (?, ?, ?, 'reserved', ?, ?)",
+            (scope, month, int(chars), now, now)
+        )
+        conn.execute("COMMIT")
+        return cur.lastrowid
+    finally:
+        conn.close()
+        write_status()
+
+
+def _finish(reservation_id: int, state: str, chars: int | None = None):
+    conn = _connect()
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        if chars is None:
+            conn.execute(
+                "UPDATE ledger SET state = ?, updated = ? WHERE id = ?",
+                (state, time.time(), reservation_id)
+            )
+        else:
+            conn.execute(
+                "UPDATE ledger SET state = ?, chars = ?, updated = ? WHERE id = ?",
+                (state, int(chars), time.time(), reservation_id)
+            )
+        conn.execute("COMMIT")
+    finally:
+        conn.close()
+        write_status()
+
+
+def commit(reservation_id: int, chars: int | None = None):
+    """Turn a reservation into consumed usage (optionally with the actual character count)."""
+    _finish(reservation_id, "committed", chars)
+
+
+def release(reservation_id: int):
+    """Give back a reservation whose synthesis failed."""
+    _finish(reservation_id, "released")
+
+
+def monthly_usage(scope: str, month: str | None = None) -> int:
+    """Committed characters for `scope` in `month` (defaults to the current month)."""
+    conn = _connect()
+    try:
+        return _month_total(conn, scope, month or current_month(), include_reserved=False)
+    finally:
+        conn.close()
+
+
+def usage_summary(month: str | None = None) -> dict:
+    """Per-scope rollup for `month`: committed, reserved (in flight) and limit."""
+    month = month or current_month()
+    conn = _connect()
+    try:
+        rows = conn.execute(
+            "SELECT l.scope, "
+            "COALESCE(SUM(CASE WHEN l.state = 'committed' THEN l.chars END), 0), "
+            "COALESCE(SUM(CASE WHEN l.state = 'reserved' THEN l.chars END), 0), "
+            "m.monthly_limit "
+            "FROM ledger l LEFT JOIN limits m ON m.scope = l.scope "
+            "WHERE l.month = ? GROUP BY l.scope",
+            (month,)
+        ).fetchall()
+    finally:
+        conn.close()
+
+    return {
+        "month": month,
+        "scopes": {
+            scope: {"used": used, "reserved": reserved, "limit": limit}
+            for scope, used, reserved, limit in rows
+        },
+    }
+
+
+def write_status():
+    """Mirror the current month's rollup to data/tts_usage.json for the dashboard."""
+    try:
+        summary = usage_summary()
+        summary["used"] = sum(s["used"] for s in summary["scopes"].values())
+        summary["limit"] = sum(s["limit"] or 0 for s in summary["scopes"].values()) or None
+        atomic_write(STATUS_FILE, json.dumps(summary, indent=2))
+    except (OSError, sqlite3.Error) as e:
+        print(f"[TTSUsage] Could not write usage status: {e}")
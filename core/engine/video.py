@@ -1,58 +1,141 @@
 import re
 import os
-import random
+import json
+import time
+import hashlib
 import subprocess
 import unicodedata
 from pathlib import Path
-from core.engine.gpu import detect_gpu_backend
-import core.engine.gpu as gpu_module
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from core.engine.gpu import (
+    detect_gpu_backend,
+    max_parallel_encodes,
+    encoder_profile,
+    video_filter_args,
+    audio_encoder_args,
+)
+from core.engine.footage_index import FootageIndex, probe_media
+from core.engine.ffmpeg_runner import run_ffmpeg, run_probe
+from core.utils.common import get_global_settings, file_lock
+
+# Complex scale filter to ensure we crop to 1080x1920 without stretching
+NORMALIZE_FILTER = "fps=30,scale=w='if(gt(a,1080/1920),-1,1080)':h='if(gt(a,1080/1920),1920,-1)',crop=1080:1920"
+# CRITICAL: Force a standard timebase for all clips so concat doesn't corrupt timestamps.
+# CRITICAL: Force keyframes every 30 frames (-g 30) so Remotion can seek flawlessly without glitching.
+NORMALIZE_OUTPUT_ARGS = ["-video_track_timescale", "90000", "-g", "30", "-an"]
+
+DEFAULT_CACHE_BUDGET_GB = 20
+SETTLE_SECONDS = 5  # a raw clip must be unmodified this long before it is hashed or normalized
 
 def get_media_duration(media_path: Path) -> float:
     try:
-        res = subprocess.run(
+        res = run_probe(
             ["ffprobe", "-v", "error", "-show_entries", "format=duration", 
              "-of", "default=noprint_wrappers=1:nokey=1", str(media_path)],
-            capture_output=True, text=True, check=True
+            label=f"ffprobe {media_path.name}", check=True
         )
         return float(res.stdout.strip())
     except Exception as e:
         print(f"[MediaInfo] Could not read duration of {media_path.name}")
         return 0.0
 
-def _normalize_video(raw_path: Path, cache_path: Path):
-    """Normalizes a raw video to 1080x1920, 30fps, no audio using the best GPU backend."""
-    backend = detect_gpu_backend()
-    print(f"[FootageExtractor] 🔄 Normalizing {raw_path.name} on {backend} GPU...")
-    
-    # Complex scale filter to ensure we crop to 1080x1920 without stretching
-    vf = "fps=30,scale=w='if(gt(a,1080/1920),-1,1080)':h='if(gt(a,1080/1920),1920,-1)',crop=1080:1920"
-    
-    command = ["ffmpeg", "-y", "-hide_banner", "-loglevel", "error"]
+def _normalize_video(
+    raw_path: Path,
+    cache_path: Path,
+    start: float | None = None,
+    duration: float | None = None,
+    threads: int | None = None
+):
+    """
+    Normalizes a raw video to 1080x1920, 30fps, no audio using the best GPU backend.
+    `start`/`duration` restrict the encode to a section of the input (used for stitch tails).
+    `threads` caps libx264 threads when several normalizations share the CPU.
+    """
+    profile = encoder_profile("intermediate")
+    print(f"[FootageExtractor] 🔄 Normalizing {raw_path.name} on {profile['backend']} GPU...")
     
-    if backend == "vaapi":
-        device = gpu_module._working_vaapi_device or "/dev/dri/renderD128"
-        command.extend(["-init_hw_device", f"vaapi=va:{device}", "-filter_hw_device", "va", "-i", str(raw_path)])
-        vf += ",format=nv12,hwupload"
-        command.extend(["-vf", vf, "-c:v", "h264_vaapi", "-qp", "16"])
-    elif backend == "videotoolbox":
-        command.extend(["-i", str(raw_path), "-vf", vf, "-c:v", "h264_videotoolbox", "-q:v", "50"])
-    elif backend == "nvenc":
-        command.extend(["-i", str(raw_path), "-vf", vf, "-c:v", "h264_nvenc", "-preset", "p4"])
-    else:
-        command.extend(["-i", str(raw_path), "-vf", vf, "-c:v", "libx264", "-preset", "fast"])
+    command = ["ffmpeg", "-y", "-hide_banner", "-loglevel", "error", *profile["input"]]
 
-    # CRITICAL: Force a standard timebase for all clips so concat doesn't corrupt timestamps.
-    # CRITICAL: Force keyframes every 30 frames (-g 30) so Remotion can seek flawlessly without glitching.
-    command.extend(["-video_track_timescale", "90000", "-g", "30", "-an", str(cache_path)])
-    
-    subprocess.run(command, check=True)
+    if start is not None:
+        command.extend(["-ss", str(start)])
+    command.extend(["-i", str(raw_path)])
+    if duration is not None:
+        command.extend(["-t", str(duration)])
 
-def _get_ready_assets(folder: Path) -> list[Path]:
-    """Checks the cache and normalizes only what is missing."""
-    cache_dir = folder / ".cached"
-    cache_dir.mkdir(exist_ok=True)
+    command.extend([*video_filter_args(profile, NORMALIZE_FILTER), *profile["video"]])
+    if threads and profile["backend"] == "cpu":
+        command.extend(["-threads", str(threads)])
+
+    command.extend([*NORMALIZE_OUTPUT_ARGS, str(cache_path)])
     
-    ready_files = []
+    run_ffmpeg(command, label=f"normalize {raw_path.name}", duration=duration)
+
+def _normalize_locked(raw_path: Path, cache_path: Path, threads: int | None = None):
+    """
+    Normalizes under a per-file lock into a partial file that is renamed into
+    place when complete, so concurrent pipelines never encode the same clip
+    twice or read a half-written `_norm.mp4`.
+    """
+    lock_path = cache_path.parent / ".locks" / f"{cache_path.name}.lock"
+    with file_lock(lock_path):
+        if cache_path.exists():
+            # Another pipeline finished it while we waited for the lock
+            return
+        partial_path = cache_path.with_name(f"{cache_path.stem}.partial{cache_path.suffix}")
+        try:
+            _normalize_video(raw_path, partial_path, threads=threads)
+            os.replace(partial_path, cache_path)
+        finally:
+            if partial_path.exists():
+                partial_path.unlink()
+
+def normalize_many(
+    jobs: list[tuple[Path, Path]],
+    max_workers: int | None = None,
+    on_progress=None
+) -> list[Path]:
+    """
+    Normalizes (raw_path, cache_path) pairs on a bounded worker pool sized for
+    the detected encoder backend. Returns the cache paths that are ready.
+    `on_progress(done, total, raw_path, ok)` is called as each job finishes.
+    """
+    if not jobs:
+        return []
+
+    backend = detect_gpu_backend()
+    workers = min(max_workers or max_parallel_encodes(backend), len(jobs))
+    threads = None
+    if backend == "cpu":
+        threads = max(1, (os.cpu_count() or 1) // workers)
+
+    print(f"[FootageExtractor] Normalizing {len(jobs)} clip(s) with {workers} worker(s) on {backend}...")
+
+    ready = []
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {
+            pool.submit(_normalize_locked, raw, cache, threads): (raw, cache)
+            for raw, cache in jobs
+        }
+        for done, future in enumerate(as_completed(futures), start=1):
+            raw, cache = futures[future]
+            ok = False
+            try:
+                future.result()
+                ready.append(cache)
+                ok = True
+                print(f"[FootageExtractor] ✅ [{done}/{len(jobs)}] Normalized {raw.name}")
+            except subprocess.CalledProcessError as e:
+                print(f"[FootageExtractor] ❌ [{done}/{len(jobs)}] Failed to normalize {raw.name}: {e}")
+            if on_progress:
+                on_progress(done, len(jobs), raw, ok)
+
+    return ready
+
+def list_footage(folder: Path) -> list[Path]:
+    """Returns every raw clip in a footage folder."""
+    (folder / ".cached").mkdir(exist_ok=True)
+
+    files = []
     
     for file in folder.iterdir():
         if not file.is_file():
@@ -62,16 +145,105 @@ def _get_ready_assets(folder: Path) -> list[Path]:
         if file.name.startswith("clip_stitched"):
             continue
             
-        cache_path = cache_dir / f"{file.stem}_norm.mp4"
+        files.append(file)
+
+    return files
+
+def is_settled(path: Path) -> bool:
+    """Skip files that are still being copied in."""
+    try:
+        return time.time() - path.stat().st_mtime >= SETTLE_SECONDS
+    except OSError:
+        return False
+
+def cache_path_for(raw_path: Path, index: FootageIndex) -> Path:
+    """
+    Content-addressed cache location for a raw clip. The key covers the source
+    bytes, the encoder profile and the normalization filter, so replacing a
+    file or changing how clips are normalized never serves stale output.
+    """
+    profile = encoder_profile("intermediate")
+    key_material = [index.source_hash(raw_path), profile["backend"], profile["video"], NORMALIZE_FILTER, NORMALIZE_OUTPUT_ARGS]
+    key = hashlib.blake2b(json.dumps(key_material).encode(), digest_size=8).hexdigest()
+    return index.cache_dir / f"{raw_path.stem}_{key}_norm.mp4"
+
+def _cache_budget_bytes() -> int:
+    budget_gb = get_global_settings().get("footage_cache_max_gb", DEFAULT_CACHE_BUDGET_GB)
+    try:
+        return int(float(budget_gb) * 1024 ** 3)
+    except (TypeError, ValueError):
+        return DEFAULT_CACHE_BUDGET_GB * 1024 ** 3
+
+def sync_footage_index(
+    index: FootageIndex,
+    candidates: list[tuple[Path, Path]],
+    sources: list[Path] | None = None
+) -> list[Path]:
+    """
+    Indexes every normalized candidate, drops vanished sources, enforces the
+    cache disk budget and returns the usable clips. `sources` lists every raw
+    clip still present (default: the candidates), so clips that were left out
+    of this pass, e.g. still being copied, keep their index data.
+    """
+    ready_files = []
+    if sources is None:
+        sources = [file for file, _ in candidates]
+
+    for file, cache_path in candidates:
         if not cache_path.exists():
-            try:
-                _normalize_video(file, cache_path)
-            except subprocess.CalledProcessError as e:
-                print(f"[FootageExtractor] ❌ Failed to normalize {file.name}: {e}")
-                continue
-                
+            continue
+
+        entry = index.update(file, cache_path)
+        if not entry or entry["duration"] <= 0:
+            continue
         ready_files.append(cache_path)
-        
+
+    index.prune(sources)
+
+    removed, freed = index.evict(_cache_budget_bytes())
+    if removed:
+        print(f"[FootageCache] 🧹 Evicted {removed} clip(s), freed {freed / 1024 ** 3:.2f} GB.")
+        ready_files = [f for f in ready_files if f.exists()]
+
+    index.save()
+    return ready_files
+
+def _get_ready_assets(
+    folder: Path,
+    index: FootageIndex | None = None,
+    normalize_missing: bool = True,
+    restore_evicted: bool = False,
+    filename: str | None = None
+) -> list[Path]:
+    """
+    Checks the cache, normalizes only what is missing and keeps the footage index in sync.
+    With `normalize_missing=False` clips that are not cached yet are skipped instead.
+    Clips evicted for space are left out unless `restore_evicted` is set, in which case
+    only they (optionally just those matching `filename`) are normalized again.
+    """
+    if index is None:
+        index = FootageIndex(folder / ".cached")
+    sources = list_footage(folder)
+    # Hashing a file that is still being copied in is wasted work that would repeat every run
+    settled = [f for f in sources if is_settled(f)]
+    if not normalize_missing:
+        # New sources are hashed by the ingest daemon, keep that I/O off the production path
+        settled = [f for f in settled if index.hash_known(f)]
+    candidates = [(f, cache_path_for(f, index)) for f in settled]
+
+    missing = [(f, c) for f, c in candidates if not c.exists()]
+    evicted = [(f, c) for f, c in missing if index.is_evicted(f, c)]
+    print(f"[FootageCache] {len(candidates) - len(missing)} hit(s), {len(missing)} miss(es), "
+          f"{len(evicted)} evicted{'' if normalize_missing else ' (left to the ingest daemon)'}.")
+
+    if restore_evicted:
+        normalize_many([(f, c) for f, c in evicted if not filename or filename in c.name])
+    elif normalize_missing:
+        normalize_many([job for job in missing if job not in evicted])
+
+    ready_files = sync_footage_index(index, candidates, sources)
+    print(f"[FootageCache] {index.cache_size() / 1024 ** 3:.2f} / "
+          f"{_cache_budget_bytes() / 1024 ** 3:.0f} GB used.")
     return ready_files
 
 def extract_footage(
@@ -79,91 +251,224 @@ def extract_footage(
     target_length: float,
     start_from: float | None = None,
     filename: str | None = None,
-    output_path: Path | None = None
+    output_path: Path | None = None,
+    stitch_mode: str = "auto"
 ) -> Path:
     """
     Extracts a clip of a given length from a folder of long videos.
-    Uses FFmpeg concat demuxer for instant stitching of cached files.
+    Picks keyframe-aligned (file, start, duration) segments from the cached
+    footage and joins them with the FFmpeg concat demuxer (inpoint/outpoint),
+    so only the footage that ends up in the clip is read. `start_from` makes
+    the first segment play from that offset.
+
+    stitch_mode:
+      - "auto"   stream-copy when the cached clips are uniform, otherwise re-encode
+      - "copy"   prefer stream copy (still falls back to re-encode if it fails)
+      - "encode" always re-encode the whole concatenation
     """
     folder = Path(folder)
 
     if output_path is None:
         output_path = folder / f"clip_stitched_{int(target_length)}.mp4"
 
-    ready_files = _get_ready_assets(folder)
-    
-    if filename:
-        ready_files = [f for f in ready_files if filename in f.name]
+    from core.ingest import is_ingest_running
+
+    index = FootageIndex(folder / ".cached")
+
+    def ready_assets(**kwargs) -> list[Path]:
+        files = _get_ready_assets(folder, index, filename=filename, **kwargs)
+        return [f for f in files if filename in f.name] if filename else files
+
+    # When the ingestion daemon is up it owns normalization; only use what it has cached
+    ready_files = []
+    if is_ingest_running():
+        ready_files = ready_assets(normalize_missing=False)
+    if not ready_files:
+        ready_files = ready_assets()
+    if not ready_files:
+        # Only clips evicted for space are left: bring them back for this run
+        ready_files = ready_assets(restore_evicted=True)
     
     if not ready_files:
         raise ValueError(f"No valid background videos found in {folder}")
 
-    random.shuffle(ready_files)
-
-    total_len = 0.0
-    selected = []
-    for f in ready_files:
-        if total_len >= target_length: 
-            break
-        selected.append(f)
-        total_len += get_media_duration(f)
-
-    # If still not enough footage, loop the selected ones until we reach target length
-    if total_len < target_length:
-        print("[FootageExtractor] Not enough footage even after stitching. Looping to fill duration.")
-        idx = 0
-        while total_len < target_length:
-            f = selected[idx % len(selected)]
-            selected.append(f)
-            total_len += get_media_duration(f)
-            idx += 1
-
-    # Stitch using FFmpeg concat demuxer
-    concat_list = folder / "concat_list.txt"
+    segments = index.select_segments(ready_files, target_length, start_from=start_from)
+    if not segments:
+        raise ValueError(f"No indexed background footage available in {folder}")
+    index.touch([p for p, _, _ in segments])
+    index.save()
+
+    print(f"[FootageExtractor] Selected {len(segments)} segment(s) from "
+          f"{len({s[0] for s in segments})} clip(s).")
+
+    entries = {p: index.entry_for(p) for p, _, _ in segments}
+    concat_list = folder / f"concat_{output_path.stem}.txt"
+
+    try:
+        if stitch_mode != "encode" and _can_stream_copy(list(entries.values())):
+            try:
+                _stitch_copy(segments, entries, concat_list, output_path)
+            except (subprocess.CalledProcessError, ValueError) as e:
+                print(f"[FootageExtractor] ⚠️ Stream-copy stitch failed ({e}). Falling back to full re-encode.")
+                _stitch_encode(segments, target_length, concat_list, output_path)
+        else:
+            if stitch_mode == "copy":
+                print("[FootageExtractor] ⚠️ Inputs are not uniform enough for stream copy. Re-encoding.")
+            _stitch_encode(segments, target_length, concat_list, output_path)
+    finally:
+        if concat_list.exists():
+            concat_list.unlink()
+    
+    print(f"[FootageExtractor] Saved clip → {output_path}")
+    return output_path
+
+def _can_stream_copy(entries: list[dict | None]) -> bool:
+    """True when every clip shares codec parameters and sits on a uniform keyframe grid."""
+    if not entries or any(e is None for e in entries):
+        return False
+    first = entries[0]
+    return all(
+        e["codec"] == first["codec"] and e.get("keyframe_interval") and e.get("keyframes")
+        for e in entries
+    )
+
+def _write_concat_list(concat_list: Path, segments: list[tuple[Path, float, float | None]]):
+    """Writes a concat demuxer list; a `None` duration plays the file to its end."""
     with open(concat_list, "w") as f:
-        for s in selected:
-            f.write(f"file '{s.absolute()}'\n")
+        for path, start, duration in segments:
+            f.write(f"file '{Path(path).absolute()}'\n")
+            if start:
+                f.write(f"inpoint {start:.3f}\n")
+            if duration is not None:
+                f.write(f"outpoint {start + duration:.3f}\n")
+
+def _stitch_encode(segments: list[tuple[Path, float, float]], target_length: float, concat_list: Path, output_path: Path):
+    """Decode the selected segments and re-encode them in one pass."""
+    _write_concat_list(concat_list, segments)
+    profile = encoder_profile("final")
 
     cmd = [
         "ffmpeg", "-y", "-hide_banner", "-loglevel", "error",
         "-f", "concat", "-safe", "0",
+        *profile["input"],
         "-i", str(concat_list),
         "-t", str(target_length),
-        "-c:v", "libx264",
-        "-preset", "fast",
-        "-crf", "14",
+        *video_filter_args(profile),
+        *profile["video"],
+        "-an", str(output_path)
+    ]
+    run_ffmpeg(cmd, label=f"stitch {output_path.name}", duration=target_length)
+
+def _stitch_copy(segments: list[tuple[Path, float, float]], entries: dict[Path, dict], concat_list: Path, output_path: Path):
+    """
+    Stream-copy the keyframe-aligned segments and only re-encode the short
+    tail after the last keyframe of the final segment when it is off the grid.
+    """
+    *body, (last, start, length) = segments
+    last_entry = entries[last]
+    end = start + length
+
+    items = list(body)
+    tail_path = None
+
+    # Last keyframe we can cut on without decoding
+    cut = max((k for k in last_entry["keyframes"] if start <= k <= end + 0.001), default=start)
+    if cut > start:
+        items.append((last, start, cut - start))
+
+    tail_len = end - cut
+    if tail_len > 0.001:
+        tail_path = output_path.with_name(f"{output_path.stem}_tail.mp4")
+        _normalize_video(last, tail_path, start=cut, duration=tail_len)
+        if probe_media(tail_path)["codec"] != last_entry["codec"]:
+            tail_path.unlink()
+            raise ValueError("tail encode does not match clip codec parameters")
+        items.append((tail_path, 0.0, None))
+
+    print(f"[FootageExtractor] ⚡ Stream-copy stitching {len(items)} segment(s)"
+          f"{' + re-encoded tail' if tail_path else ''}.")
+    _write_concat_list(concat_list, items)
+
+    cmd = [
+        "ffmpeg", "-y", "-hide_banner", "-loglevel", "error",
+        "-f", "concat", "-safe", "0",
+        "-i", str(concat_list),
+        "-c", "copy",
+        "-video_track_timescale", "90000",
         "-an", str(output_path)
     ]
-    
     try:
-        subprocess.run(cmd, check=True)
+        run_ffmpeg(cmd, label=f"stitch-copy {output_path.name}", duration=sum(d for _, _, d in segments))
     finally:
-        if concat_list.exists():
-            concat_list.unlink()
-    
-    print(f"[FootageExtractor] Saved clip → {output_path}")
-    return output_path
+        if tail_path and tail_path.exists():
+            tail_path.unlink()
 
-def split_video(input_file: Path, output_dir: Path, max_duration=70):
-    """Split video into short clips using raw FFmpeg."""
-    clips = []
-    total_duration = int(get_media_duration(input_file))
-    
-    for i, start in enumerate(range(0, total_duration, max_duration)):
-        end = min(start + max_duration, total_duration)
-        duration = end - start
-        part_file = output_dir / f"{input_file.stem}_part{i+1}.mp4"
-        
-        cmd = [
-            "ffmpeg", "-y", "-hide_banner", "-loglevel", "error",
+def _keyframes_allow_copy(input_file: Path, max_duration: float, tolerance: float = 0.05) -> bool:
+    """True when the input already has a keyframe at every split point."""
+    try:
+        meta = probe_media(input_file)
+    except Exception:
+        return False
+    keyframes = meta["keyframes"]
+    cut = max_duration
+    while cut < meta["duration"]:
+        if not any(abs(k - cut) <= tolerance for k in keyframes):
+            return False
+        cut += max_duration
+    return bool(keyframes)
+
+def split_video(input_file: Path, output_dir: Path, max_duration=70, mode: str = "auto"):
+    """
+    Split video into short clips in a single FFmpeg pass using the segment muxer.
+
+    mode:
+      - "auto"   stream-copy when keyframes already sit on every split point, otherwise encode
+      - "copy"   always stream-copy (parts end on the nearest following keyframe)
+      - "encode" re-encode on the detected GPU backend with keyframes forced at each split
+    """
+    input_file = Path(input_file)
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    if mode == "auto":
+        mode = "copy" if _keyframes_allow_copy(input_file, max_duration) else "encode"
+
+    pattern = output_dir / f"{input_file.stem}_part%d.mp4"
+    segment_list = output_dir / f"{input_file.stem}_parts.txt"
+
+    command = ["ffmpeg", "-y", "-hide_banner", "-loglevel", "error"]
+
+    if mode == "copy":
+        command.extend(["-i", str(input_file), "-map", "0", "-c", "copy"])
+    else:
+        profile = encoder_profile("final")
+        command.extend([
+            *profile["input"],
             "-i", str(input_file),
-            "-ss", str(start),
-            "-t", str(duration),
-            "-c:v", "libx264", "-c:a", "aac",
-            str(part_file)
-        ]
-        subprocess.run(cmd, check=True)
-        clips.append(part_file)
+            *video_filter_args(profile),
+            *profile["video"],
+            "-force_key_frames", f"expr:gte(t,n_forced*{max_duration})",
+            *audio_encoder_args(pattern),
+        ])
+
+    print(f"[VideoSplitter] Splitting {input_file.name} into {max_duration}s parts ({mode})...")
+
+    command.extend([
+        "-f", "segment",
+        "-segment_time", str(max_duration),
+        "-segment_start_number", "1",
+        "-reset_timestamps", "1",
+        "-segment_list", str(segment_list),
+        "-segment_list_type", "flat",
+        str(pattern)
+    ])
+
+    try:
+        run_ffmpeg(command, label=f"split {input_file.name}")
+        clips = [output_dir / Path(name).name for name in segment_list.read_text().splitlines() if name.strip()]
+    finally:
+        if segment_list.exists():
+            segment_list.unlink()
 
     return clips
 
@@ -0,0 +1,150 @@
+"""
+Background footage ingestion daemon.
+
+Watches media/video/game (inotify when available, polling otherwise),
+normalizes newly dropped raw clips into `.cached`, keeps the footage
+index up to date and publishes queue/progress to data/ingest_stats.json
+for the dashboard. Started alongside the web app from start.sh:
+
+    python -m core.ingest
+"""
+
+import json
+import time
+import threading
+from pathlib import Path
+from datetime import datetime, timezone
+from core.utils.common import atomic_write
+
+try:
+    from inotify_simple import INotify, flags
+except ImportError:  # Not on Linux / not installed: poll instead
+    INotify = None
+
+FOOTAGE_DIR = Path("media/video/game")
+STATUS_FILE = Path("data/ingest_stats.json")
+
+POLL_INTERVAL = 5       # seconds between scans when nothing wakes us up
+HEARTBEAT_INTERVAL = 5
+STALE_AFTER = 30        # status older than this means the daemon is gone
+
+_status = {
+    "watcher": "polling",
+    "queue": 0,
+    "active": None,
+    "done": 0,
+    "total": 0,
+    "failed": 0,
+    "clips": 0,
+    "footage_seconds": 0.0,
+}
+_status_lock = threading.Lock()
+
+
+def is_ingest_running() -> bool:
+    """True when a daemon has written a fresh heartbeat to the status file."""
+    try:
+        data = json.loads(STATUS_FILE.read_text())
+        ts = datetime.fromisoformat(data["timestamp"])
+    except Exception:
+        return False
+    return (datetime.now(timezone.utc) - ts).total_seconds() < STALE_AFTER
+
+
+def _update_status(**fields):
+    with _status_lock:
+        _status.update(fields)
+
+
+def _write_status():
+    with _status_lock:
+        data = dict(_status, timestamp=datetime.now(timezone.utc).isoformat())
+    atomic_write(STATUS_FILE, json.dumps(data, indent=2))
+
+
+def _heartbeat():
+    """Keep the status file fresh while long encodes block the main loop."""
+    while True:
+        try:
+            _write_status()
+        except Exception as e:
+            print(f"[Ingest] Could not write status: {e}")
+        time.sleep(HEARTBEAT_INTERVAL)
+
+
+def _make_waiter(folder: Path):
+    """Returns a callable that blocks until the folder changes or POLL_INTERVAL passes."""
+    if INotify is not None:
+        try:
+            inotify = INotify()
+            inotify.add_watch(
+                str(folder),
+                flags.CLOSE_WRITE | flags.MOVED_TO | flags.MOVED_FROM | flags.DELETE
+            )
+            _update_status(watcher="inotify")
+            print(f"[Ingest] Watching {folder} with inotify.")
+            return lambda: inotify.read(timeout=POLL_INTERVAL * 1000)
+        except OSError as e:
+            print(f"[Ingest] inotify unavailable ({e}), falling back to polling.")
+
+    _update_status(watcher="polling")
+    print(f"[Ingest] Polling {folder} every {POLL_INTERVAL}s.")
+    return lambda: time.sleep(POLL_INTERVAL)
+
+
+def ingest_once(folder: Path = FOOTAGE_DIR):
+    """Normalize every settled, uncached clip in `folder` and refresh the index."""
+    from core.engine.video import list_footage, is_settled, cache_path_for, normalize_many, sync_footage_index
+    from core.engine.footage_index import FootageIndex
+
+    index = FootageIndex(folder / ".cached")
+    sources = list_footage(folder)
+    # Files still being copied in are neither hashed nor indexed yet
+    candidates = [(f, cache_path_for(f, index)) for f in sources if is_settled(f)]
+    # Clips evicted for space are only normalized again when a pipeline needs them
+    pending = [(f, c) for f, c in candidates if not c.exists() and not index.is_evicted(f, c)]
+    _update_status(queue=len(pending))
+
+    if pending:
+        failed = 0
+
+        def on_progress(done, total, raw, ok):
+            nonlocal failed
+            failed += 0 if ok else 1
+            _update_status(queue=total - done, done=done, failed=failed)
+
+        _update_status(done=0, total=len(pending), failed=0, active=", ".join(f.name for f, _ in pending[:3]))
+        normalize_many(pending, on_progress=on_progress)
+
+    ready = sync_footage_index(index, candidates, sources)
+    _update_status(
+        queue=0,
+        total=0,
+        active=None,
+        clips=len(ready),
+        footage_seconds=round(sum(index.durations().get(c.name, 0.0) for c in ready), 1),
+    )
+
+
+def main():
+    from core.engine.gpu import refresh_capabilities_if_due
+
+    folder = FOOTAGE_DIR
+    folder.mkdir(parents=True, exist_ok=True)
+
+    wait = _make_waiter(folder)
+    threading.Thread(target=_heartbeat, daemon=True).start()
+    print(f"[Ingest] Started for {folder}")
+
+    while True:
+        try:
+            ingest_once(folder)
+            # Between passes the daemon's own encodes are idle: a good time for the daily GPU re-probe
+            refresh_capabilities_if_due()
+        except Exception as e:
+            print(f"[Ingest] ❌ Ingest pass failed: {e}")
+        wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,171 @@
+"""
+Warm Whisper transcription worker.
+
+Loads the faster-whisper model once and serves word-level transcriptions to
+pipeline runs over a local socket, so no video pays the model load again.
+Started alongside the web app from start.sh:
+
+    python -m core.transcriber
+
+Pipelines call `transcribe_words` / `transcribe_batch`. When the worker is not
+running (or does not answer within REQUEST_TIMEOUT) the model is loaded
+in-process instead and kept for the rest of that process.
+
+The worker listens on a Unix socket under data/ (loopback TCP on Windows) and
+only accepts clients that know the random key it writes to data/ at startup,
+readable by the same user only. Model size, `cpu_threads` and `num_workers` come from the global
+settings (whisper_model, whisper_cpu_threads, whisper_num_workers).
+"""
+
+import os
+import sys
+import threading
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Listener, Client
+from core.utils.common import atomic_write
+
+SOCKET_PATH = Path("data/transcriber.sock")
+TCP_ADDRESS = ("127.0.0.1", 6011)   # Windows has no AF_UNIX listener
+KEY_FILE = Path("data/.transcriber_key")
+REQUEST_TIMEOUT = 600               # seconds to wait for the worker before transcribing locally
+
+DEFAULT_MODEL = "tiny.en"  # extremely fast and accurate enough for clear TTS audio
+
+_models = {}
+_model_lock = threading.Lock()
+
+
+def _address():
+    return TCP_ADDRESS if sys.platform == "win32" else str(SOCKET_PATH)
+
+
+def _write_key() -> bytes:
+    """Fresh random key for this worker run, readable by the current user only."""
+    key = os.urandom(32)
+    atomic_write(KEY_FILE, key, mode=0o600)
+    return key
+
+
+def whisper_config() -> dict:
+    """Model settings from data/settings.json (0 threads = let CTranslate2 decide)."""
+    from core.utils.common import get_global_settings
+    settings = get_global_settings()
+    return {
+        "model": settings.get("whisper_model") or DEFAULT_MODEL,
+        "cpu_threads": int(settings.get("whisper_cpu_threads") or 0),
+        "num_workers": max(1, int(settings.get("whisper_num_workers") or 1)),
+    }
+
+
+def get_model(model: str = DEFAULT_MODEL, cpu_threads: int = 0, num_workers: int = 1):
+    """Return the cached WhisperModel for this configuration, loading it on first use."""
+    key = (model, cpu_threads, num_workers)
+    with _model_lock:
+        if key not in _models:
+            from faster_whisper import WhisperModel
+            print(f"[Transcriber] Loading Whisper model {model} "
+                  f"(cpu_threads={cpu_threads or 'auto'}, num_workers={num_workers})...")
+            # Only one configuration is kept warm at a time
+            _models.clear()
+            _models[key] = WhisperModel(
+                model, device="cpu", compute_type="int8",
+                cpu_threads=cpu_threads, num_workers=num_workers
+            )
+        return _models[key]
+
+
+def _transcribe_one(model, audio_path: str) -> list[dict]:
+    segments, _ = model.transcribe(audio_path, word_timestamps=True)
+    words = []
+    for segment in segments:
+        for word in segment.words:
+            words.append({
+                "word": word.word.strip(),
+                "start": word.start,
+                "end": word.end
+            })
+    return words
+
+
+def _transcribe_local(paths: list[str], config: dict | None = None) -> dict[str, list[dict]]:
+    config = config or whisper_config()
+    model = get_model(**config)
+    # faster-whisper runs up to num_workers transcriptions concurrently
+    with ThreadPoolExecutor(max_workers=min(config["num_workers"], len(paths)) or 1) as pool:
+        return dict(zip(paths, pool.map(lambda p: _transcribe_one(model, p), paths)))
+
+
+def transcribe_batch(audio_paths: list[str | Path]) -> dict[str, list[dict]]:
+    """
+    Word timestamps ({"word", "start", "end"}) for each audio file, keyed by
+    absolute path. Uses the warm worker when it is running.
+    """
+    paths = [str(Path(p).resolve()) for p in audio_paths]
+    if not paths:
+        return {}
+
+    try:
+        conn = Client(_address(), authkey=KEY_FILE.read_bytes())
+    except (OSError, EOFError, AuthenticationError):
+        return _transcribe_local(paths)
+
+    with conn:
+        conn.send({"paths": paths})
+        if not conn.poll(REQUEST_TIMEOUT):
+            print(f"[Transcriber] ⚠️ Worker did not answer within {REQUEST_TIMEOUT}s, transcribing locally.")
+            return _transcribe_local(paths)
+        reply = conn.recv()
+    if "error" in reply:
+        raise RuntimeError(f"Transcriber worker failed: {reply['error']}")
+    return reply["results"]
+
+
+def transcribe_words(audio_path: str | Path) -> list[dict]:
+    """Word timestamps for a single audio file."""
+    return transcribe_batch([audio_path]).get(str(Path(audio_path).resolve()), [])
+
+
+def _handle(conn):
+    with conn:
+        try:
+            request = conn.recv()
+            paths = request.get("paths", [])
+            print(f"[Transcriber] Transcribing {len(paths)} file(s)...")
+            conn.send({"results": _transcribe_local(paths)})
+        except EOFError:
+            pass
+        except Exception as e:
+            print(f"[Transcriber] ❌ Request failed: {e}")
+            try:
+                conn.send({"error": str(e)})
+            except OSError:
+                pass
+
+
+def main():
+    # Load up front so the first request is already warm
+    get_model(**whisper_config())
+
+    address = _address()
+    if isinstance(address, str):
+        SOCKET_PATH.parent.mkdir(exist_ok=True)
+        # A socket left behind by a previous run would make bind() fail
+        SOCKET_PATH.unlink(missing_ok=True)
+
+    with Listener(address, authkey=_write_key()) as listener:
+        if isinstance(address, str):
+            os.chmod(address, 0o600)
+        print(f"[Transcriber] Listening on {address}")
+        while True:
+            try:
+                conn = listener.accept()
+            except Exception as e:
+                print(f"[Transcriber] Rejected connection: {e}")
+                continue
+            threading.Thread(target=_handle, args=(conn,), daemon=True).start()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,13 @@
+import os
 import json
+import threading
 from pathlib import Path
 from datetime import datetime
+from contextlib import contextmanager
+try:
+    import fcntl
+except ImportError:  # Windows: locks become no-ops
+    fcntl = None
 try:
     from zoneinfo import ZoneInfo
 except ImportError:
@@ -40,6 +47,73 @@ def save_global_settings(settings):
     GLOBAL_SETTINGS_PATH.parent.mkdir(exist_ok=True)
     GLOBAL_SETTINGS_PATH.write_text(json.dumps(settings, indent=4))
 
+@contextmanager
+def file_lock(lock_path: Path, blocking: bool = True):
+    """
+    Exclusive inter-process lock held for the duration of the block.
+    Yields whether it was acquired: with `blocking=False` it yields False
+    instead of waiting when another process holds the lock.
+    """
+    lock_path = Path(lock_path)
+    lock_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(lock_path, "a") as fh:
+        acquired = True
+        if fcntl:
+            try:
+                fcntl.flock(fh, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                acquired = False
+        try:
+            yield acquired
+        finally:
+            if fcntl and acquired:
+                fcntl.flock(fh, fcntl.LOCK_UN)
+
+def atomic_write(path: Path, data: str | bytes, mode: int = 0o666):
+    """
+    Write `data` to `path` through a temp file renamed into place, so readers
+    never see a partial file. `mode` applies to the new file (before umask).
+    """
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    binary = isinstance(data, bytes)
+    fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, mode)
+    try:
+        with os.fdopen(fd, "wb" if binary else "w", encoding=None if binary else "utf-8") as f:
+            f.write(data)
+        os.replace(tmp, path)
+    except BaseException:
+        tmp.unlink(missing_ok=True)
+        raise
+
+def evict_lru(directory: Path, pattern: str, max_bytes: int) -> int:
+    """
+    Delete the least-recently-used files matching `pattern` in `directory`
+    (by mtime, which cache readers bump on a hit) until they fit in
+    `max_bytes`. Returns the number of files removed.
+    """
+    files = []
+    for path in Path(directory).glob(pattern):
+        try:
+            stat = path.stat()
+        except OSError:
+            continue
+        files.append((stat.st_mtime, stat.st_size, path))
+
+    total = sum(size for _, size, _ in files)
+    removed = 0
+    for _, size, path in sorted(files):
+        if total <= max_bytes:
+            break
+        try:
+            path.unlink()
+            total -= size
+            removed += 1
+        except OSError:
+            pass
+    return removed
+
 def get_now():
     """Get current datetime in the configured global timezone."""
     settings = get_global_settings()
@@ -2,8 +2,14 @@
 
 from pathlib import Path
 from core.utils.common import load_module_config, safe_filename
-from core.api.llm import format_story_with_gpt, generate_youtube_metadata
-from core.engine.audio import generate_tts
+from concurrent.futures import ThreadPoolExecutor
+from core.api.llm import (
+    format_story_with_gpt, stream_story_with_gpt, StreamBrokenError, generate_story_package,
+    generate_youtube_metadata, generate_youtube_metadata_async, run_concurrently
+)
+from core.engine.music import generate_music_prompt_async
+from core.engine.audio import generate_tts, generate_tts_stream
+from core.engine.subtitles import words_path_for
 from core.api.google import upload_video
 from core.utils.logger import write_log
 from .fetcher import fetch_story
@@ -28,13 +34,37 @@ REDDIT_AI_PROMPT = settings.get("Reddit_Story_AI_Prompt-stringLE")
 VIDEO_UPLOAD_SPEED = settings.get("Video_Upload_Speed_MBs-integerFE")
 TTS_VOICES = settings.get("Reddit_TTS_Voice-stringME", "").split(",") if settings.get("Reddit_TTS_Voice-stringME") else []
 TTS_CHARACTER_LIMIT = settings.get("Reddit_TTS_Character_Limit-integerNE", 150000)
+TTS_CONCURRENCY = settings.get("Reddit_TTS_Concurrency-integerNE") or 4
 USE_LYRIA = settings.get("Use_Lyria_Music-booleanME", True)
+STRUCTURED_LLM = settings.get("Reddit_Structured_LLM-booleanME", True)
+STREAM_SCRIPT = settings.get("Reddit_Stream_Script-booleanME", False)
 
 OUTPUT_DIR = MODULE_DIR / "output"
 OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
 LOG_FILE = MODULE_DIR / "logs/runtime.log"
 LOG_FILE.parent.mkdir(exist_ok=True)
 
+def _request_metadata_and_music(story: dict, formatted_story: str):
+    """
+    Metadata and music prompt only depend on the script: request them together
+    on a background thread. Returns a future of [metadata, music prompt].
+    """
+    write_log(LOG_FILE, "Generating YouTube metadata and music prompt...")
+    llm_calls = [
+        generate_youtube_metadata_async(
+            original_title=story["title"],
+            story_text=formatted_story,
+            subreddit=story["subreddit"],
+            url=story["url"]
+        )
+    ]
+    if USE_LYRIA:
+        llm_calls.append(generate_music_prompt_async(formatted_story, "Reddit Story"))
+    llm_pool = ThreadPoolExecutor(max_workers=1)
+    llm_results = llm_pool.submit(run_concurrently, *llm_calls)
+    llm_pool.shutdown(wait=False)
+    return llm_results
+
 def run_video_pipeline():
     write_log(LOG_FILE, "Starting Reddit story video generation pipeline...")
     story = fetch_story(MAX_RETRIES, MIN_SCORE, MIN_LENGTH, SUBREDDITS)
@@ -48,41 +78,101 @@ def run_video_pipeline():
     length_instruction = f"IMPORTANT: Write the script so it takes approximately {TARGET_LENGTH} minutes to read aloud at a conversational pace (~150 words per minute. Target word count: ~{int(TARGET_LENGTH * 150)} words)."
     
     ai_input = f"{REDDIT_AI_PROMPT}\n{length_instruction}\n\nTitle: {story['title']}\n\n{story['body']}"
-    formatted_story = format_story_with_gpt(ai_input)
-    if not formatted_story:
-        write_log(LOG_FILE, "❌ LLM failed to format story. Aborting pipeline.")
-        return
-        
-    write_log(LOG_FILE, "Formatted story with GPT.")
 
-    # Save TTS audio in OUTPUT_DIR
     safe_title = safe_filename(story['title'])
     audio_file_path = OUTPUT_DIR / f"{story['subreddit']}_{safe_title}.mp3"
-    write_log(LOG_FILE, f"Generating TTS audio at {audio_file_path}...")
+    package = None
+    llm_results = None
+    audio_path = None
+
+    if STREAM_SCRIPT:
+        # Stream the script straight into TTS: synthesis starts with the first LLM output
+        write_log(LOG_FILE, f"Streaming script into TTS audio at {audio_file_path}...")
+        try:
+            audio_path, formatted_story = generate_tts_stream(
+                text_stream=stream_story_with_gpt(ai_input),
+                output_file=audio_file_path,
+                TTS_VOICES=TTS_VOICES,
+                TTS_CHARACTER_LIMIT=TTS_CHARACTER_LIMIT,
+                config_path=config_path,
+                concurrency=TTS_CONCURRENCY,
+                word_timings=True
+            )
+        except StreamBrokenError as e:
+            # Only the LLM side is retried: quota and TTS errors would just fail again below
+            write_log(LOG_FILE, f"⚠️ Streaming script generation failed ({e}). Retrying without streaming.")
+        else:
+            if not formatted_story.strip():
+                write_log(LOG_FILE, "❌ LLM failed to format story. Aborting pipeline.")
+                return
+            write_log(LOG_FILE, "Formatted story with GPT.")
+            llm_results = _request_metadata_and_music(story, formatted_story)
+
+    if audio_path is None:
+        # One structured request for script + metadata + music prompt, separate requests as fallback
+        package = generate_story_package(
+            ai_input,
+            original_title=story["title"],
+            subreddit=story["subreddit"],
+            url=story["url"]
+        ) if STRUCTURED_LLM else None
+
+        if package:
+            formatted_story = package.script
+            write_log(LOG_FILE, "Generated script, metadata and music prompt in one request.")
+        else:
+            formatted_story = format_story_with_gpt(ai_input)
+            if not formatted_story:
+                write_log(LOG_FILE, "❌ LLM failed to format story. Aborting pipeline.")
+                return
+            
+            write_log(LOG_FILE, "Formatted story with GPT.")
+            # Requested in the background while the narration is synthesized
+            llm_results = _request_metadata_and_music(story, formatted_story)
+
+        # Save TTS audio in OUTPUT_DIR
+        write_log(LOG_FILE, f"Generating TTS audio at {audio_file_path}...")
     
-    # Generate TTS
-    audio_path = generate_tts(
-        text=formatted_story, 
-        output_file=audio_file_path, 
-        TTS_VOICES=TTS_VOICES, 
-        TTS_CHARACTER_LIMIT=TTS_CHARACTER_LIMIT, 
-        config_path=config_path
-    )
+        # Generate TTS
+        audio_path = generate_tts(
+            text=formatted_story, 
+            output_file=audio_file_path, 
+            TTS_VOICES=TTS_VOICES, 
+            TTS_CHARACTER_LIMIT=TTS_CHARACTER_LIMIT, 
+            config_path=config_path,
+            concurrency=TTS_CONCURRENCY,
+            word_timings=True
+        )
 
     # Create final video
     video_output_path = OUTPUT_DIR / f"{story['subreddit']}_{safe_title}.mp4"
     write_log(LOG_FILE, f"Creating video at {video_output_path}...")
-    final_video = create_video(formatted_story, audio_path, video_output_path, title_text=story['title'], use_lyria=USE_LYRIA)
-
-    # Generate YouTube metadata
-    write_log(LOG_FILE, "Generating YouTube metadata...")
-    yt_title, yt_desc, yt_tags = generate_youtube_metadata(
-        original_title=story["title"],
-        story_text=formatted_story,
-        subreddit=story["subreddit"],
-        url=story["url"]
+    if package:
+        music_prompt = package.music_prompt or None
+        music_mood = package.music_mood or None
+        metadata = (package.youtube_title, package.youtube_description, package.tags)
+    else:
+        results = llm_results.result()
+        music_mood = None  # create_video reads it from the music prompt
+        music_prompt = results[1] if USE_LYRIA and isinstance(results[1], str) else None
+        metadata = None if isinstance(results[0], BaseException) else results[0]
+
+    final_video = create_video(
+        formatted_story, audio_path, video_output_path,
+        title_text=story['title'], use_lyria=USE_LYRIA,
+        music_mood=music_mood, music_prompt=music_prompt
     )
 
+    # YouTube metadata (requested alongside the script or the music prompt)
+    if metadata is None:
+        metadata = generate_youtube_metadata(
+            original_title=story["title"],
+            story_text=formatted_story,
+            subreddit=story["subreddit"],
+            url=story["url"]
+        )
+    yt_title, yt_desc, yt_tags = metadata
+
     TEST_MODE = settings.get("Test_Mode-booleanME", True)
     
     if TEST_MODE:
@@ -109,6 +199,7 @@ def run_video_pipeline():
     try:
         if audio_path and Path(audio_path).exists():
             Path(audio_path).unlink()
+            words_path_for(audio_path).unlink(missing_ok=True)
             write_log(LOG_FILE, f"Cleaned up temporary audio file: {audio_path}")
     except Exception as e:
         write_log(LOG_FILE, f"Failed to clean up {audio_path}: {e}")
@@ -1,17 +1,20 @@
 import json
-import random
 import subprocess
 from pathlib import Path
 from core.engine.video import extract_footage, get_media_duration
-from core.api.llm import transcribe_audio_with_timestamps
+from core.engine.subtitles import build_subtitles
 from core.engine.music import generate_music_lyria
+from core.engine.mixer import mix_audio_bed
+from core.engine.music_catalog import MusicCatalog
 
 def create_video(
     story_text: str,
     audio_file: Path,
     output_file: Path,
     title_text: str = None,
-    use_lyria: bool = True
+    use_lyria: bool = True,
+    music_mood: str | None = None,
+    music_prompt: str | None = None
 ):
     print("Preparing assets for Remotion rendering...")
 
@@ -33,8 +36,8 @@ def create_video(
     )
     print(f"Using extracted background footage: {extracted_path}")
 
-    # 2. Transcribe Subtitles
-    word_data = transcribe_audio_with_timestamps(str(audio_file))
+    # 2. Subtitles (aligned to the script, Whisper if alignment is unsure)
+    word_data = build_subtitles(audio_file, script=story_text)
     if not word_data:
         word_data = [] # Fallback, Remotion handles empty words gracefully
 
@@ -47,7 +50,8 @@ def create_video(
                 script=story_text, 
                 video_type="Reddit Story", 
                 duration_sec=int(tts_duration) + 5,
-                output_path=lyria_music_path
+                output_path=lyria_music_path,
+                music_prompt=music_prompt
             )
             if lyria_music_path.exists():
                 music_path = lyria_music_path
@@ -55,11 +59,16 @@ def create_video(
             print(f"Lyria generation failed, falling back to random local music: {e}")
 
     if not music_path:
-        music_dir = Path("media/audio/music")
-        if music_dir.exists():
-            music_files = [f for f in music_dir.iterdir() if f.suffix.lower() in [".mp3", ".wav", ".m4a"] and "lyria_custom" not in f.name]
-            if music_files:
-                music_path = random.choice(music_files)
+        # Indexed once per track; picks something long enough not to loop
+        catalog = MusicCatalog(Path("media/audio/music")).sync()
+        # Without an explicit mood, use whatever catalog tag the music prompt asks for
+        music_mood = music_mood or catalog.match_mood(music_prompt)
+        if music_mood:
+            print(f"Looking for {music_mood} local music...")
+        music_path = catalog.choose(min_duration=tts_duration, mood=music_mood)
+        if music_path:
+            entry = catalog.entry_for(music_path)
+            print(f"Using local music {music_path.name} ({entry['duration']:.0f}s, {entry['bpm']} BPM, {', '.join(entry['tags'])})")
 
     # 4. Prepare props for Remotion
     project_root = Path(__file__).resolve().parent.parent.parent
@@ -68,11 +77,23 @@ def create_video(
     output_file.parent.mkdir(parents=True, exist_ok=True)
 
     duration_frames = int(tts_duration * 30)
+
+    # Pre-mix voice + ducked music into one track so Remotion only plays it back
+    audio_bed = None
+    try:
+        audio_bed = mix_audio_bed(
+            voice_path=audio_file,
+            output_path=audio_file.with_suffix(".bed.m4a"),
+            duration=duration_frames / 30,
+            music_path=music_path
+        )
+    except Exception as e:
+        print(f"Audio bed mix failed, letting Remotion mix the tracks: {e}")
     
     props = {
         "bgVideoPath": str(extracted_path) if extracted_path else "",
-        "ttsAudioPath": str(audio_file),
-        "musicPath": str(music_path) if music_path else "",
+        "ttsAudioPath": str(audio_bed or audio_file),
+        "musicPath": str(music_path) if music_path and not audio_bed else "",
         "words": word_data,
         "title": title_text or "Reddit Story",
         "durationInFrames": duration_frames
@@ -108,7 +129,9 @@ def create_video(
     except subprocess.CalledProcessError as e:
         print(f"Remotion rendering failed: {e}")
         
-    # Clean up temporary footage
+    # Clean up temporary footage and audio bed
+    if audio_bed:
+        audio_bed.unlink(missing_ok=True)
     try:
         if extracted_path and Path(extracted_path).exists():
             Path(extracted_path).unlink()
@@ -3,5 +3,11 @@
 # Start the system monitor in the background
 python core/monitor.py &
 
+# Start the background footage ingestion daemon
+python -m core.ingest &
+
+# Start the warm Whisper transcription worker
+python -m core.transcriber &
+
 # Start the Flask application
 python app.py
@@ -3,6 +3,10 @@
 document.addEventListener("DOMContentLoaded", () => {
     const socket = io();
     const timezoneSelect = document.getElementById("timezone-select");
+    const cacheBudgetInput = document.getElementById("footage-cache-budget");
+    const whisperModelSelect = document.getElementById("whisper-model");
+    const whisperThreadsInput = document.getElementById("whisper-cpu-threads");
+    const whisperWorkersInput = document.getElementById("whisper-num-workers");
     const saveBtn = document.getElementById("save-global-settings");
 
     // Load current settings
@@ -12,11 +16,27 @@ document.addEventListener("DOMContentLoaded", () => {
         if (data.timezone) {
             timezoneSelect.value = data.timezone;
         }
+        if (data.footage_cache_max_gb) {
+            cacheBudgetInput.value = data.footage_cache_max_gb;
+        }
+        if (data.whisper_model) {
+            whisperModelSelect.value = data.whisper_model;
+        }
+        if (data.whisper_cpu_threads !== undefined) {
+            whisperThreadsInput.value = data.whisper_cpu_threads;
+        }
+        if (data.whisper_num_workers) {
+            whisperWorkersInput.value = data.whisper_num_workers;
+        }
     });
 
     saveBtn.addEventListener("click", () => {
         const settings = {
-            timezone: timezoneSelect.value
+            timezone: timezoneSelect.value,
+            footage_cache_max_gb: parseFloat(cacheBudgetInput.value) || 20,
+            whisper_model: whisperModelSelect.value,
+            whisper_cpu_threads: parseInt(whisperThreadsInput.value) || 0,
+            whisper_num_workers: parseInt(whisperWorkersInput.value) || 1
         };
         socket.emit("save_global_settings", settings);
         saveBtn.innerText = "Saving...";
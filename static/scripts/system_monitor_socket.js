@@ -42,6 +42,30 @@ socket.on("stats", (s = {}) => {
         });
     }
 
+    const ingest = s.ingest;
+    const ingestFresh = ingest && (Date.now() - new Date(ingest.timestamp).getTime()) < 30000;
+    if (ingestFresh) {
+        const progress = ingest.total ? `${ingest.done}/${ingest.total}` : "Idle";
+        badges += createBadge("Footage Queue", fmt(ingest.queue));
+        badges += createBadge("Footage Ingest", progress);
+        badges += createBadge("Footage Clips", fmt(ingest.clips));
+    }
+
+    // One entry per running ffmpeg job; entries that stopped updating belong to killed runs
+    const encodes = Object.values(s.encode?.jobs || {})
+        .filter((job) => (Date.now() - new Date(job.timestamp).getTime()) < 30000);
+    encodes.forEach((job) => {
+        const pct = job.percent !== null && job.percent !== undefined ? ` ${job.percent}%` : "";
+        badges += createBadge("Encoding", `${job.label}${pct} · ${fmt(job.fps, " fps")} · ${fmt(job.speed, "x")}`);
+    });
+
+    const tts = s.tts;
+    if (tts && tts.used !== undefined) {
+        const used = tts.used.toLocaleString();
+        const usage = tts.limit ? `${used} / ${tts.limit.toLocaleString()}` : used;
+        badges += createBadge(`TTS Chars (${tts.month})`, usage);
+    }
+
     monitorEl.innerHTML = badges;
     if (timestampEl) timestampEl.textContent = `Last update: ${timestamp}`;
 });
\ No newline at end of file
@@ -0,0 +1,42 @@
+import random
+
+from core.engine.text_chunks import chunk_text, stream_chunks
+
+
+def _random_script(rng: random.Random) -> str:
+    words = ["alpha", "beta", "gamma", "delta", "Mr.", "ok?", "yes!", "end."]
+    separators = [" ", "  ", "   ", "\n", "\n\n", " \n ", ". ", ".  ", "!\n ", "? \n\n  "]
+    parts = []
+    for _ in range(rng.randint(1, 120)):
+        parts.append(rng.choice(words))
+        parts.append(rng.choice(separators))
+    return "".join(parts)
+
+
+def _split_randomly(text: str, rng: random.Random) -> list[str]:
+    cuts = sorted(rng.sample(range(len(text) + 1), min(len(text), rng.randint(0, 40))))
+    return [text[a:b] for a, b in zip([0, *cuts], [*cuts, len(text)])]
+
+
+def test_stream_chunks_matches_chunk_text():
+    rng = random.Random(0)
+    for _ in range(2000):
+        text = _random_script(rng)
+        max_chars = rng.choice([20, 50, 120, 800])
+        pieces = _split_randomly(text, rng)
+        assert list(stream_chunks(pieces, max_chars)) == chunk_text(text, max_chars)
+
+
+def test_whitespace_split_across_pieces():
+    # The run of spaces after "one." arrives in two pieces; carried over, the
+    # leading spaces would push "Sentence two." past the limit into its own chunk
+    pieces = ["Sentence one. ", "  Sentence two.\n", " Three"]
+    text = "".join(pieces)
+    assert list(stream_chunks(pieces, 28)) == chunk_text(text, 28)
+    assert list(stream_chunks(pieces, 28)) == ["Sentence one. Sentence two.", "Three"]
+
+
+def test_character_by_character():
+    text = "First line.   Second?\n\n  Third!  Fourth  \n Fifth"
+    for max_chars in (10, 30, 600):
+        assert list(stream_chunks(iter(text), max_chars)) == chunk_text(text, max_chars)
@@ -70,10 +70,18 @@ def load_stats(stats_file: Path):
     except json.JSONDecodeError:
         return {}
 
-def push_stats(socketio, stats_file: Path):
-    """Emit system stats every second."""
+def push_stats(socketio, stats_file: Path, extra_files: dict[str, Path] | None = None):
+    """
+    Emit system stats every second. Each entry of `extra_files` (e.g. footage
+    ingestion or ffmpeg progress status) is attached under its key when present.
+    """
     while True:
-        socketio.emit("stats", load_stats(stats_file))
+        stats = load_stats(stats_file)
+        for key, path in (extra_files or {}).items():
+            extra = load_stats(path)
+            if extra:
+                stats[key] = extra
+        socketio.emit("stats", stats)
         socketio.sleep(1)
 
 def run_module(module_name: str, module_dir: Path, options: dict, on_finish=None):